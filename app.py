@@ -1,96 +1,203 @@
 import os
+import sys
+import math
 import logging
-from logging.handlers import RotatingFileHandler
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for
 from datetime import datetime
 import sqlite3
+import json
+
+from logging_utils import setup_logging, truncate
+from telemetry import telemetry
+from profiler import RequestProfiler
+from control_channel import ControlChannel
+from db_schema import COLUMNS, create_schema
+from db_stats import health_report
+from sharding import ShardedStore, merge_sorted
 
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'app.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=5        # Keep 5 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging through the shared background writer
+setup_logging('app.log', sample_every={
+    # Every collector posts every few seconds, so only keep one payload in ten
+    'metrics_payload': 10,
+    'stock_metrics_payload': 10
+})
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+telemetry.init_app(app)
+
+# Profile a request with cProfile when it asks for it (X-Debug-Profile: 1 or
+# ?_profile=1) or with this probability, and keep statements slower than the
+# threshold together with their query plans
+PROFILE_SAMPLE_RATE = 0.0
+SLOW_QUERY_THRESHOLD_MS = 200
+profiler = RequestProfiler(sample_rate=PROFILE_SAMPLE_RATE, slow_query_ms=SLOW_QUERY_THRESHOLD_MS)
+profiler.init_app(app, telemetry)
 
 # Global variable to track the stop command state
 # This will be used for polling by the metrics_populator
 METRICS_STOP_COMMAND = False
 
-# Define the database path
-DATABASE_PATH = os.path.join(BASE_DIR, 'database.db')
-logger.info(f"Database path: {DATABASE_PATH}")
+# Commands for collectors, delivered by long-poll or on ingest responses
+control = ControlChannel()
+
+# Define the database path; METRICS_DATABASE_PATH points the app at another
+# file before anything is opened, e.g. the benchmark's working copy
+DATABASE_PATH = os.environ.get('METRICS_DATABASE_PATH', os.path.join(BASE_DIR, 'database.db'))
+logger.info("Database path: %s", DATABASE_PATH)
+
+# Spread the metrics over this many SQLite files in SHARD_DIR, hashed by
+# computer_id/symbol, each with its own writer. 0 keeps everything in
+# database.db. The count of an existing shard directory is changed with
+# sharding.py, which copies the data into a new directory. METRICS_SHARD_COUNT
+# overrides it.
+SHARD_COUNT = int(os.environ.get('METRICS_SHARD_COUNT', 0))
+SHARD_DIR = os.path.join(BASE_DIR, 'shards')
+
+# Columns of the system metrics DataTable, in display order. Only columns
+# backed by an index can be used for server-side ordering.
+SYSTEM_TABLE_COLUMNS = ['timestamp', 'computer_id', 'cpu_usage', 'memory_usage']
+SYSTEM_TABLE_ORDERABLE = {'timestamp', 'computer_id'}
+SYSTEM_TABLE_MAX_PAGE = 500
+
+# A computer_id prefix search ordered by timestamp walks the timestamp index
+# and filters when it matches at least this share of the rows, instead of
+# sorting every match
+SYSTEM_TABLE_SCAN_SHARE = 0.1
+
+# When sharded, every shard returns all rows up to the end of a page and the
+# offset is applied after merging, so offset paging is limited to this many
+# rows from either end of the table; deeper pages are reached with cursors
+SYSTEM_TABLE_MAX_SHARDED_OFFSET = 10000
+
+def control_for_request():
+    """Return the control message to attach to the response of this ingest request.
+    
+    Collectors identify themselves with the X-Collector-Id header (and
+    optionally X-Collector-Group) and send the epoch and last command
+    sequence number they saw in X-Control-Epoch and X-Control-Seq. A message
+    is returned when there are commands for the collector, when collectors
+    should stop, or when it does not know the current epoch yet so it can
+    resync after a restart.
+    Returns None otherwise and for anonymous clients.
+    """
+    collector_id = request.headers.get('X-Collector-Id')
+    if not collector_id:
+        return None
+    epoch = request.headers.get('X-Control-Epoch')
+    pending = control.poll(
+        collector_id,
+        group=request.headers.get('X-Collector-Group'),
+        since=request.headers.get('X-Control-Seq', type=int),
+        epoch=epoch,
+        via='ingest'
+    )
+    if pending['commands'] or pending['stop'] or pending['epoch'] != epoch:
+        return pending
+    return None
+
+def record_collector_schedule():
+    """Record the scheduling lag and skipped slots a collector sent with this ingest request.
+    
+    Collectors run by CollectorScheduler send the lag of the cycle in
+    X-Schedule-Lag-Ms and the slots skipped before it in X-Schedule-Skipped.
+    Both are recorded per collector group; a lag that is not a finite number
+    is ignored.
+    """
+    lag_ms = request.headers.get('X-Schedule-Lag-Ms', type=float)
+    if lag_ms is None or not math.isfinite(lag_ms):
+        return
+    group = request.headers.get('X-Collector-Group') or 'none'
+    telemetry.observe('collector_schedule_lag_seconds', max(lag_ms, 0) / 1000, group=group)
+    skipped = request.headers.get('X-Schedule-Skipped', 0, type=int)
+    if skipped > 0:
+        telemetry.increment('collector_schedule_skipped_total', skipped, group=group)
+
+def ingest_response(body, status, table, records):
+    """Build the response to an ingest request whose rows have been committed.
+    
+    Records the ingest telemetry and attaches any control message. The rows
+    are stored by now, so a failure here is logged instead of being returned
+    as an error, which the collector would answer by posting them again.
+    """
+    try:
+        telemetry.mark('ingest_rows_total', records, table=table)
+        record_collector_schedule()
+        pending = control_for_request()
+        if pending:
+            body["control"] = pending
+    except Exception as e:
+        logger.error("Error handling the collector headers of an ingest request: %s", e)
+    return jsonify(body), status
+
+def connect_db():
+    """Open a connection to the database."""
+    return sqlite3.connect(DATABASE_PATH)
 
 # Function to create database and table
 def init_db():
     try:
         with sqlite3.connect(DATABASE_PATH) as conn:
-            # Create laptop metrics table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS laptop_metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    computer_id TEXT,
-                    cpu_usage REAL,
-                    memory_usage REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Create stock metrics table
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS stock_metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT,
-                    price REAL,
-                    change_percent REAL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
+            # Tables, indexes and row counters are defined in db_schema
+            create_schema(conn)
             logger.info("Database initialized successfully")
     except Exception as e:
-        logger.error(f"Error initializing database: {e}")
+        logger.error("Error initializing database: %s", e)
 
 # Initialize the database
 init_db()
+store = ShardedStore(SHARD_DIR, SHARD_COUNT) if SHARD_COUNT else None
+
+def insert_rows(table, statement, rows):
+    """Insert rows given in db_schema.COLUMNS order, into their shards when sharded."""
+    if store is not None:
+        return store.insert(table, statement, rows)
+    with connect_db() as conn:
+        telemetry.begin_write(conn, table)
+        cur = conn.cursor()
+        telemetry.execute(cur, statement, f'''
+            INSERT INTO {table} ({', '.join(COLUMNS[table])})
+            VALUES ({', '.join('?' * len(COLUMNS[table]))})
+        ''', rows, many=True)
+        telemetry.commit(conn, table)
+    return len(rows)
+
+def fetch_all_shards(statement, sql, params=(), row_factory=None, key=None):
+    """Run a read query and return its rows as one list per shard.
+    
+    Without sharding the list holds the rows of database.db only, so callers
+    merge the same way in both cases. With a key only the shard holding that
+    computer_id/symbol is queried.
+    """
+    if store is not None:
+        return store.fetch_all(statement, sql, params, row_factory=row_factory, key=key)
+    with connect_db() as conn:
+        conn.row_factory = row_factory
+        return [telemetry.fetch_all(conn.cursor(), statement, sql, params)]
+
+def sort_key(*columns):
+    """Merge key matching SQLite's ORDER BY on the columns, where NULL sorts first."""
+    return lambda row: tuple((row[c] is not None, row[c] if row[c] is not None else '') for c in columns)
 
 @app.route('/metrics', methods=['POST'])
 def receive_metrics():
     if request.is_json:
         data = request.get_json()
         client_ip = request.remote_addr
-        logger.info(f"Received metrics data from IP {client_ip}: {data}")
+        logger.info("Received metrics data from IP %s: %s", client_ip, truncate(data),
+                    extra={'msg_type': 'metrics_payload'})
         try:
-            with sqlite3.connect(DATABASE_PATH) as conn:
-                cur = conn.cursor()
-                cur.execute('''
-                    INSERT INTO laptop_metrics (computer_id, cpu_usage, memory_usage, timestamp)
-                    VALUES (?, ?, ?, ?)
-                ''', (data.get('computer_id', 'unknown'), data.get('cpu_usage'), data.get('memory_usage'), datetime.now()))
-                conn.commit()
+            insert_rows('laptop_metrics', 'insert_laptop_metrics', [
+                (data.get('computer_id', 'unknown'), data.get('cpu_usage'), data.get('memory_usage'), datetime.now())
+            ])
             logger.info("Successfully inserted metrics data into database")
-            return jsonify({"message": "Metrics received"}), 200
         except Exception as e:
-            logger.error(f"Error inserting metrics data: {e}")
+            logger.error("Error inserting metrics data: %s", e)
             return jsonify({"error": f"Database error: {str(e)}"}), 500
+        return ingest_response({"message": "Metrics received"}, 200, 'laptop_metrics', 1)
     logger.warning("Received non-JSON request")
     return jsonify({"error": "Request must be JSON"}), 400
 
@@ -98,20 +205,21 @@ def receive_metrics():
 def api_metrics():
     metric = None
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute('SELECT computer_id, cpu_usage, memory_usage, timestamp FROM laptop_metrics ORDER BY id DESC LIMIT 1')
-            row = cur.fetchone()
-            if row:
-                metric = {
-                    'computer_id': row[0],
-                    'cpu_usage': row[1],
-                    'memory_usage': row[2],
-                    'last_updated': row[3]
-                }
-                logger.info(f"Retrieved latest metrics: {metric}")
+        # Latest row of each shard, then the newest of those
+        results = fetch_all_shards('latest_laptop_metrics',
+            'SELECT computer_id, cpu_usage, memory_usage, timestamp FROM laptop_metrics ORDER BY id DESC LIMIT 1')
+        latest = merge_sorted(results, key=sort_key(3), reverse=True, limit=1)
+        if latest:
+            row = latest[0]
+            metric = {
+                'computer_id': row[0],
+                'cpu_usage': row[1],
+                'memory_usage': row[2],
+                'last_updated': row[3]
+            }
+            logger.info("Retrieved latest metrics: %s", truncate(metric))
     except Exception as e:
-        logger.error(f"Error retrieving metrics: {e}")
+        logger.error("Error retrieving metrics: %s", e)
     
     return jsonify(metric if metric else {})
 
@@ -119,44 +227,23 @@ def api_metrics():
 def receive_stock_metrics():
     if request.is_json:
         data = request.get_json()
-        logger.info(f"Received stock metrics data: {data}")
+        logger.info("Received stock metrics data: %s", truncate(data),
+                    extra={'msg_type': 'stock_metrics_payload'})
         try:
-            with sqlite3.connect(DATABASE_PATH) as conn:
-                cur = conn.cursor()
-                records_inserted = 0
-                
-                # Check if we have data for multiple stocks
-                if isinstance(data, list):
-                    for stock in data:
-                        cur.execute('''
-                            INSERT INTO stock_metrics (symbol, price, change_percent, timestamp)
-                            VALUES (?, ?, ?, ?)
-                        ''', (
-                            stock.get('symbol'), 
-                            stock.get('price'), 
-                            stock.get('change_percent'), 
-                            stock.get('timestamp')
-                        ))
-                        records_inserted += 1
-                else:
-                    # Single stock data
-                    cur.execute('''
-                        INSERT INTO stock_metrics (symbol, price, change_percent, timestamp)
-                        VALUES (?, ?, ?, ?)
-                    ''', (
-                        data.get('symbol'), 
-                        data.get('price'), 
-                        data.get('change_percent'), 
-                        data.get('timestamp')
-                    ))
-                    records_inserted += 1
-                
-                conn.commit()
-            logger.info(f"Successfully inserted {records_inserted} stock metrics records into database")
-            return jsonify({"status": "success", "records_inserted": records_inserted}), 201
+            # Accept either a list of stocks or a single stock
+            stocks = data if isinstance(data, list) else [data]
+            records_inserted = insert_rows('stock_metrics', 'insert_stock_metrics', [(
+                stock.get('symbol'), 
+                stock.get('price'), 
+                stock.get('change_percent'), 
+                stock.get('timestamp')
+            ) for stock in stocks])
+            logger.info("Successfully inserted %s stock metrics records into database", records_inserted)
         except Exception as e:
-            logger.error(f"Error inserting stock metrics data: {e}")
+            logger.error("Error inserting stock metrics data: %s", e)
             return jsonify({"error": f"Database error: {str(e)}"}), 500
+        return ingest_response({"status": "success", "records_inserted": records_inserted}, 201,
+                               'stock_metrics', records_inserted)
     logger.warning("Received non-JSON request for stock metrics")
     return jsonify({"error": "Request must be JSON"}), 400
 
@@ -164,34 +251,32 @@ def receive_stock_metrics():
 def api_stock_metrics():
     stocks = []
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cur = conn.cursor()
-            # Get the latest data for each stock symbol
-            cur.execute('''
-                SELECT s1.symbol, s1.price, s1.change_percent, s1.timestamp
-                FROM stock_metrics s1
-                JOIN (
-                    SELECT symbol, MAX(id) as max_id
-                    FROM stock_metrics
-                    GROUP BY symbol
-                ) s2 ON s1.symbol = s2.symbol AND s1.id = s2.max_id
-            ''')
-            rows = cur.fetchall()
-            
-            for row in rows:
-                stocks.append({
-                    'symbol': row[0],
-                    'price': row[1],
-                    'change_percent': row[2],
-                    'timestamp': row[3]
-                })
-            
-            if stocks:
-                logger.info(f"Retrieved {len(stocks)} stock records")
-            else:
-                logger.warning("No stock data found in database")
+        # Get the latest data for each stock symbol; a symbol lives in one
+        # shard, so the per-shard results only need concatenating
+        results = fetch_all_shards('latest_stock_metrics', '''
+            SELECT s1.symbol, s1.price, s1.change_percent, s1.timestamp
+            FROM stock_metrics s1
+            JOIN (
+                SELECT symbol, MAX(id) as max_id
+                FROM stock_metrics
+                GROUP BY symbol
+            ) s2 ON s1.symbol = s2.symbol AND s1.id = s2.max_id
+        ''')
+        
+        for row in (row for rows in results for row in rows):
+            stocks.append({
+                'symbol': row[0],
+                'price': row[1],
+                'change_percent': row[2],
+                'timestamp': row[3]
+            })
+        
+        if stocks:
+            logger.info("Retrieved %s stock records", len(stocks))
+        else:
+            logger.warning("No stock data found in database")
     except Exception as e:
-        logger.error(f"Error retrieving stock data: {e}")
+        logger.error("Error retrieving stock data: %s", e)
     
     return jsonify(stocks)
 
@@ -200,32 +285,28 @@ def api_historical_system_metrics():
     """Endpoint to get historical system metrics data for charts"""
     metrics = []
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row  # This enables column access by name
-            cur = conn.cursor()
-            
-            # Get data from the last 24 hours (or adjust as needed)
-            cur.execute('''
-                SELECT cpu_usage, memory_usage, timestamp 
-                FROM laptop_metrics 
-                ORDER BY timestamp ASC
-                LIMIT 100
-            ''')
-            
-            rows = cur.fetchall()
-            for row in rows:
-                metrics.append({
-                    'cpu_usage': row['cpu_usage'],
-                    'memory_usage': row['memory_usage'],
-                    'timestamp': row['timestamp']
-                })
-            
-            if metrics:
-                logger.info(f"Retrieved {len(metrics)} historical system metrics records")
-            else:
-                logger.warning("No historical system metrics found in database")
+        # Get data from the last 24 hours (or adjust as needed)
+        results = fetch_all_shards('historical_laptop_metrics', '''
+            SELECT cpu_usage, memory_usage, timestamp 
+            FROM laptop_metrics 
+            ORDER BY timestamp ASC
+            LIMIT 100
+        ''', row_factory=sqlite3.Row)  # This enables column access by name
+        rows = merge_sorted(results, key=sort_key('timestamp'), limit=100)
+        
+        for row in rows:
+            metrics.append({
+                'cpu_usage': row['cpu_usage'],
+                'memory_usage': row['memory_usage'],
+                'timestamp': row['timestamp']
+            })
+        
+        if metrics:
+            logger.info("Retrieved %s historical system metrics records", len(metrics))
+        else:
+            logger.warning("No historical system metrics found in database")
     except Exception as e:
-        logger.error(f"Error retrieving historical system metrics: {e}")
+        logger.error("Error retrieving historical system metrics: %s", e)
     
     return jsonify(metrics)
 
@@ -235,91 +316,258 @@ def api_historical_stock_metrics():
     metrics = []
     
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            
-            # Get historical data for all symbols (100 records per symbol)
-            cur.execute('''
-                WITH ranked_data AS (
-                    SELECT 
-                        symbol, 
-                        price, 
-                        change_percent, 
-                        timestamp,
-                        ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) as rn
-                    FROM stock_metrics
-                )
-                SELECT symbol, price, change_percent, timestamp
-                FROM ranked_data
-                WHERE rn <= 300
-                ORDER BY symbol, timestamp ASC
-            ''')
-            
-            rows = cur.fetchall()
-            for row in rows:
-                metrics.append({
-                    'symbol': row['symbol'],
-                    'price': row['price'],
-                    'change_percent': row['change_percent'],
-                    'timestamp': row['timestamp']
-                })
-            
-            if metrics:
-                logger.info(f"Retrieved {len(metrics)} historical stock metrics records")
-            else:
-                logger.warning("No historical stock metrics found in database")
+        # Get historical data for all symbols (100 records per symbol)
+        results = fetch_all_shards('historical_stock_metrics', '''
+            WITH ranked_data AS (
+                SELECT 
+                    symbol, 
+                    price, 
+                    change_percent, 
+                    timestamp,
+                    ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) as rn
+                FROM stock_metrics
+            )
+            SELECT symbol, price, change_percent, timestamp
+            FROM ranked_data
+            WHERE rn <= 300
+            ORDER BY symbol, timestamp ASC
+        ''', row_factory=sqlite3.Row)
+        rows = merge_sorted(results, key=sort_key('symbol', 'timestamp'))
+        
+        for row in rows:
+            metrics.append({
+                'symbol': row['symbol'],
+                'price': row['price'],
+                'change_percent': row['change_percent'],
+                'timestamp': row['timestamp']
+            })
+        
+        if metrics:
+            logger.info("Retrieved %s historical stock metrics records", len(metrics))
+        else:
+            logger.warning("No historical stock metrics found in database")
     except Exception as e:
-        logger.error(f"Error retrieving historical stock metrics: {e}")
+        logger.error("Error retrieving historical stock metrics: %s", e)
     
     return jsonify(metrics)
 
+def prefix_upper_bound(prefix):
+    """Return the smallest string greater than every string starting with prefix.
+    
+    Returns None when there is none, i.e. the prefix is all U+10FFFF.
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    code = ord(prefix[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        # Surrogates cannot be encoded for SQLite; none is a valid character
+        code = 0xE000
+    return prefix[:-1] + chr(code)
+
+def prefix_range(column, prefix):
+    """Return the condition and parameters matching values of column that start with prefix."""
+    upper = prefix_upper_bound(prefix)
+    if upper is None:
+        return f'{column} >= ?', [prefix]
+    return f'{column} >= ? AND {column} < ?', [prefix, upper]
+
+def encode_table_cursor(sort_value, row_id):
+    """Encode the sort key of a row as an opaque keyset cursor."""
+    return json.dumps([sort_value, row_id])
+
+def decode_table_cursor(cursor):
+    """Decode a keyset cursor, returning None if it is malformed."""
+    try:
+        sort_value, row_id = json.loads(cursor)
+        # Only values SQLite can bind; bool is an int subclass but never a sort value
+        if isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float, type(None))):
+            return None
+        if isinstance(row_id, bool) or not isinstance(row_id, int):
+            return None
+        return sort_value, row_id
+    except (TypeError, ValueError):
+        return None
+
+def count_system_metrics(search):
+    """Return (total, filtered) row counts from the maintained counters."""
+    total = sum(rows[0][0] for rows in fetch_all_shards('count_laptop_metrics',
+        'SELECT COALESCE(SUM(row_count), 0) FROM laptop_metrics_counts'))
+    if not search:
+        return total, total
+    condition, params = prefix_range('computer_id', search)
+    filtered = sum(rows[0][0] for rows in fetch_all_shards('count_laptop_metrics_filtered', f'''
+        SELECT COALESCE(SUM(row_count), 0)
+        FROM laptop_metrics_counts
+        WHERE {condition}
+    ''', params))
+    return total, filtered
+
+def system_metrics_table_page(args):
+    """Serve one page of the system metrics DataTable (server-side protocol)."""
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 10, type=int)
+    if length <= 0 or length > SYSTEM_TABLE_MAX_PAGE:
+        length = SYSTEM_TABLE_MAX_PAGE
+    search = args.get('search[value]', '').strip()
+    
+    # Ordering is only allowed on indexed columns, id breaks ties
+    order_index = args.get('order[0][column]', 0, type=int)
+    order_column = 'timestamp'
+    if 0 <= order_index < len(SYSTEM_TABLE_COLUMNS):
+        if SYSTEM_TABLE_COLUMNS[order_index] in SYSTEM_TABLE_ORDERABLE:
+            order_column = SYSTEM_TABLE_COLUMNS[order_index]
+    descending = args.get('order[0][dir]', 'desc').lower() != 'asc'
+    
+    total, filtered = count_system_metrics(search)
+    
+    where = []
+    params = []
+    if search:
+        # Prefix match as a range so the computer_id index can be used. When
+        # ordering by timestamp and the prefix matches a large share of the
+        # rows, that would sort every match for each page; walking the
+        # timestamp index and filtering ends after a few pages' worth of rows,
+        # so the unary + keeps SQLite off the computer_id index
+        column = 'computer_id'
+        if order_column == 'timestamp' and filtered >= total * SYSTEM_TABLE_SCAN_SHARE:
+            column = '+computer_id'
+        condition, condition_params = prefix_range(column, search)
+        where.append(condition)
+        params.extend(condition_params)
+    
+    cursor = decode_table_cursor(args.get('cursor')) if args.get('cursor') else None
+    if cursor:
+        # Keyset paging: continue after the last row of the previous page
+        where.append(f"({order_column}, id) {'<' if descending else '>'} (?, ?)")
+        params.extend(cursor)
+        offset = 0
+    else:
+        offset = start
+    
+    # Every shard has to supply rows up to the end of the page, the offset
+    # is applied after merging. Deep pages near the end of the table (e.g.
+    # "last") are read backwards from the end instead. A request with a
+    # cursor, such as the table refreshing a page it reached with Next, is
+    # served through the cursor whatever its start.
+    count = length
+    backwards = False
+    if store is not None and offset > SYSTEM_TABLE_MAX_SHARDED_OFFSET:
+        rows_after = filtered - offset - length
+        if rows_after > SYSTEM_TABLE_MAX_SHARDED_OFFSET:
+            return {
+                'draw': draw,
+                'recordsTotal': total,
+                'recordsFiltered': filtered,
+                'data': [],
+                'next_cursor': None,
+                'error': "This page is too deep to jump to; page forward with Next or narrow the search"
+            }
+        backwards = True
+        count = max(min(length, filtered - offset), 0)
+        offset = max(rows_after, 0)
+    reverse = descending != backwards
+    sql_direction = 'DESC' if reverse else 'ASC'
+    
+    shard_limit, shard_offset = (count + offset, 0) if store is not None else (count, offset)
+    sql = f'''
+        SELECT id, computer_id, cpu_usage, memory_usage, timestamp
+        FROM laptop_metrics
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY {order_column} {sql_direction}, id {sql_direction}
+        LIMIT ? OFFSET ?
+    '''
+    results = fetch_all_shards('laptop_metrics_table_page', sql, params + [shard_limit, shard_offset],
+                               row_factory=sqlite3.Row)
+    rows = merge_sorted(results, key=sort_key(order_column, 'id'), reverse=reverse,
+                        limit=shard_limit)[offset - shard_offset:]
+    if backwards:
+        rows.reverse()
+    
+    data = [{
+        'id': row['id'],
+        'computer_id': row['computer_id'],
+        'cpu_usage': row['cpu_usage'],
+        'memory_usage': row['memory_usage'],
+        'timestamp': row['timestamp']
+    } for row in rows]
+    
+    next_cursor = None
+    if len(rows) == length:
+        last = rows[-1]
+        next_cursor = encode_table_cursor(last[order_column], last['id'])
+    
+    return {
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': data,
+        'next_cursor': next_cursor
+    }
+
 @app.route('/api/system_metrics/table', methods=['GET'])
 def api_system_metrics_table():
-    """Endpoint to get system metrics data for the DataTable"""
+    """Endpoint to get system metrics data for the DataTable.
+    
+    Requests carrying the DataTables ``draw`` parameter are answered with the
+    server-side protocol (paging, ordering, computer_id prefix search).
+    Otherwise the latest ``limit`` rows are returned as a plain list.
+    """
+    if 'draw' in request.args:
+        try:
+            page = system_metrics_table_page(request.args)
+            logger.info("Served %s of %s system metrics records for table", len(page['data']), page['recordsFiltered'])
+            return jsonify(page)
+        except Exception as e:
+            logger.error("Error retrieving system metrics page for table: %s", e)
+            return jsonify({
+                'draw': request.args.get('draw', 0, type=int),
+                'recordsTotal': 0,
+                'recordsFiltered': 0,
+                'data': [],
+                'error': f"Database error: {str(e)}"
+            })
+    
     computer_id = request.args.get('computer_id', None)
     limit = request.args.get('limit', 100, type=int)
     metrics = []
     
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            
-            if computer_id:
-                # Get data for a specific computer
-                cur.execute('''
-                    SELECT id, computer_id, cpu_usage, memory_usage, timestamp 
-                    FROM laptop_metrics 
-                    WHERE computer_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (computer_id, limit))
-            else:
-                # Get data for all computers
-                cur.execute('''
-                    SELECT id, computer_id, cpu_usage, memory_usage, timestamp 
-                    FROM laptop_metrics 
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (limit,))
-            
-            rows = cur.fetchall()
-            for row in rows:
-                metrics.append({
-                    'id': row['id'],
-                    'computer_id': row['computer_id'],
-                    'cpu_usage': row['cpu_usage'],
-                    'memory_usage': row['memory_usage'],
-                    'timestamp': row['timestamp']
-                })
-            
-            if metrics:
-                logger.info(f"Retrieved {len(metrics)} system metrics records for table")
-            else:
-                logger.warning("No system metrics found in database for table")
+        if computer_id:
+            # Get data for a specific computer, only its shard holds any
+            results = fetch_all_shards('laptop_metrics_table_computer', '''
+                SELECT id, computer_id, cpu_usage, memory_usage, timestamp 
+                FROM laptop_metrics 
+                WHERE computer_id = ?
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (computer_id, limit), row_factory=sqlite3.Row, key=computer_id)
+        else:
+            # Get data for all computers
+            results = fetch_all_shards('laptop_metrics_table', '''
+                SELECT id, computer_id, cpu_usage, memory_usage, timestamp 
+                FROM laptop_metrics 
+                ORDER BY timestamp DESC
+                LIMIT ?
+            ''', (limit,), row_factory=sqlite3.Row)
+        rows = merge_sorted(results, key=sort_key('timestamp'), reverse=True, limit=limit)
+        
+        for row in rows:
+            metrics.append({
+                'id': row['id'],
+                'computer_id': row['computer_id'],
+                'cpu_usage': row['cpu_usage'],
+                'memory_usage': row['memory_usage'],
+                'timestamp': row['timestamp']
+            })
+        
+        if metrics:
+            logger.info("Retrieved %s system metrics records for table", len(metrics))
+        else:
+            logger.warning("No system metrics found in database for table")
     except Exception as e:
-        logger.error(f"Error retrieving system metrics for table: {e}")
+        logger.error("Error retrieving system metrics for table: %s", e)
     
     return jsonify(metrics)
 
@@ -340,7 +588,11 @@ def toggle_metrics_stop():
     METRICS_STOP_COMMAND = not METRICS_STOP_COMMAND
     
     current_state = "STOP" if METRICS_STOP_COMMAND else "RUN"
-    logger.info(f"Metrics populator command set to: {current_state}")
+    logger.info("Metrics populator command set to: %s", current_state)
+    
+    # Collectors on the control channel are told right away, and ones that
+    # connect later with their first control message
+    control.set_stopped(METRICS_STOP_COMMAND)
     
     return jsonify({
         "status": "success",
@@ -359,5 +611,102 @@ def get_metrics_status():
         "command": current_state
     })
 
+@app.route('/api/control/poll', methods=['GET'])
+def api_control_poll():
+    """Long-poll endpoint for collectors waiting on control commands"""
+    collector_id = request.args.get('collector_id')
+    if not collector_id:
+        return jsonify({"error": "collector_id is required"}), 400
+    
+    pending = control.poll(
+        collector_id,
+        group=request.args.get('group'),
+        since=request.args.get('since', type=int),
+        epoch=request.args.get('epoch'),
+        timeout=request.args.get('timeout', 0, type=float)
+    )
+    return jsonify(pending)
+
+@app.route('/api/control/commands', methods=['POST'])
+def api_control_publish():
+    """Endpoint to send a command to all collectors, a group or one collector"""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request must be a JSON object"}), 400
+    try:
+        entry = control.publish(
+            data.get('command'),
+            collector_id=data.get('collector_id'),
+            group=data.get('group'),
+            interval=data.get('interval')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    logger.info("Published control command %s", entry)
+    return jsonify({"status": "success", "command": entry}), 201
+
+@app.route('/api/control/commands', methods=['GET'])
+def api_control_commands():
+    """Endpoint listing recently published control commands"""
+    return jsonify(control.recent_commands())
+
+@app.route('/api/control/collectors', methods=['GET'])
+def api_control_collectors():
+    """Endpoint listing the collectors seen on the control channel"""
+    return jsonify(control.list_collectors())
+
+@app.route('/api/telemetry', methods=['GET'])
+def api_telemetry():
+    """Endpoint returning a JSON snapshot of the performance telemetry"""
+    return jsonify(telemetry.snapshot())
+
+@app.route('/telemetry/prometheus', methods=['GET'])
+def telemetry_prometheus():
+    """Endpoint exposing the performance telemetry in Prometheus text format"""
+    return Response(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/health/db', methods=['GET'])
+def api_health_db():
+    """Endpoint returning the database health report
+    
+    Answers from the row counters and the database header. Pass pages=1 for
+    per-table page usage and fragmentation and verify=1 to check the counters
+    against COUNT(*); both read far more of the file.
+    """
+    pages = request.args.get('pages') == '1'
+    verify = request.args.get('verify') == '1'
+    try:
+        if store is not None:
+            # One report per shard file
+            report = {'shards': [health_report(path, pages=pages, verify=verify) for path in store.paths]}
+        else:
+            report = health_report(DATABASE_PATH, pages=pages, verify=verify)
+    except Exception as e:
+        logger.error("Error building database health report: %s", e)
+        return jsonify({"error": str(e)}), 500
+    return jsonify(report)
+
+@app.route('/api/debug/profiles', methods=['GET'])
+def api_debug_profiles():
+    """Endpoint listing the most recent request profiles"""
+    return jsonify(profiler.list_profiles())
+
+@app.route('/api/debug/profiles/<int:profile_id>', methods=['GET'])
+def api_debug_profile(profile_id):
+    """Endpoint returning one captured request profile"""
+    entry = profiler.get_profile(profile_id)
+    if entry is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return jsonify(entry)
+
+@app.route('/api/debug/slow_queries', methods=['GET'])
+def api_debug_slow_queries():
+    """Endpoint listing the most recent slow SQL statements with their query plans"""
+    return jsonify(profiler.list_slow_queries())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -1,54 +1,55 @@
 import os
 import sqlite3
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
+from logging_utils import setup_logging
+from sharding import metrics_database_paths
+
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'clear_stock_data.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=3        # Keep 3 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def clear_stock_data():
-    """Clear all stock data from the database."""
-    # Define the absolute path to the database
-    DATABASE_PATH = os.path.join(BASE_DIR, 'database.db')
+def clear_stock_data(database_path=None):
+    """Clear all stock data from the database.
+    
+    Without database_path this clears the database the app stores the
+    metrics in, every shard of it when METRICS_SHARD_COUNT is set. Returns
+    the number of records cleared, or None if any database failed.
+    """
+    try:
+        paths = metrics_database_paths(database_path)
+    except ValueError as e:
+        logger.error("Cannot find the metrics database: %s", e)
+        return None
     
-    logger.info(f"Clearing stock data from database at: {DATABASE_PATH}")
+    cleared = 0
+    for path in paths:
+        count = clear_stock_file(path)
+        if count is None:
+            return None
+        cleared += count
+    return cleared
+
+def clear_stock_file(path):
+    """Clear all stock data from one database file."""
+    logger.info("Clearing stock data from database at: %s", path)
     
     # Check if database file exists
-    if not os.path.exists(DATABASE_PATH):
-        logger.error(f"Database file does not exist at {DATABASE_PATH}")
+    if not os.path.exists(path):
+        logger.error("Database file does not exist at %s", path)
         return
     
     try:
         # Connect to the database
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with sqlite3.connect(path) as conn:
             cursor = conn.cursor()
             
             # Get count before clearing
             cursor.execute("SELECT COUNT(*) FROM stock_metrics;")
             count_before = cursor.fetchone()[0]
-            logger.info(f"Number of records in stock_metrics before clearing: {count_before}")
+            logger.info("Number of records in stock_metrics before clearing: %s", count_before)
             
             # Delete all records from stock_metrics
             cursor.execute("DELETE FROM stock_metrics;")
@@ -63,22 +64,24 @@ def clear_stock_data():
             # Verify records were deleted
             cursor.execute("SELECT COUNT(*) FROM stock_metrics;")
             count_after = cursor.fetchone()[0]
-            logger.info(f"Number of records in stock_metrics after clearing: {count_after}")
+            logger.info("Number of records in stock_metrics after clearing: %s", count_after)
             
             # Log success
-            logger.info(f"Successfully cleared {count_before} records from stock_metrics table")
+            logger.info("Successfully cleared %s records from stock_metrics table", count_before)
             
             return count_before
     
     except Exception as e:
-        logger.error(f"Error clearing stock data: {e}")
+        logger.error("Error clearing stock data: %s", e)
         return None
 
 if __name__ == "__main__":
+    # Configure logging through the shared background writer
+    setup_logging('clear_stock_data.log', backup_count=3, max_per_interval=0)
     logger.info("Starting stock data clearing process")
     records_cleared = clear_stock_data()
     if records_cleared is not None:
-        logger.info(f"Successfully cleared {records_cleared} stock records from database")
+        logger.info("Successfully cleared %s stock records from database", records_cleared)
     else:
         logger.error("Failed to clear stock data")
     logger.info("Stock data clearing process completed") 
\ No newline at end of file
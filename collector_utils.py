@@ -1,60 +1,222 @@
 import requests
 import logging
 import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
 
-# Configure logger
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from logging_utils import truncate
+
+# Logging is configured by the collector scripts through logging_utils
 logger = logging.getLogger(__name__)
 
+# How long a control long-poll is held open by the server, in seconds
+CONTROL_POLL_TIMEOUT = 25
+
+# Maximum number of failed payloads kept for a later flush
+DEFAULT_SPOOL_SIZE = 1000
+
+# Seconds to wait for the server before an ingest POST counts as failed
+DEFAULT_REQUEST_TIMEOUT = 30
+
+# What the scheduler does when a collection overruns its next deadline
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch_up'
+
 class CollectorBase:
     """Base class for metric collectors with common functionality."""
     
-    def __init__(self, endpoint_url, status_url=None, collection_interval=60, collector_name="Collector"):
+    def __init__(self, endpoint_url, status_url=None, collection_interval=60, collector_name="Collector",
+                 collector_id=None, group=None, control_url=None, spool_size=DEFAULT_SPOOL_SIZE,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT):
         """
         Initialize the collector.
         
         Args:
             endpoint_url: URL to send metrics to
-            status_url: URL to check for stop commands (optional)
+            status_url: URL to check for stop commands (optional, polled every
+                cycle; ignored when control_url is set)
             collection_interval: Interval between collections in seconds
             collector_name: Name of the collector for logging
+            collector_id: Identifier used on the control channel (optional)
+            group: Control channel group this collector belongs to (optional)
+            control_url: Long-poll URL of the control channel (optional)
+            spool_size: Number of failed payloads kept for flush_spool
+            request_timeout: Seconds to wait for the server on each POST
         """
         self.endpoint_url = endpoint_url
         self.status_url = status_url
         self.collection_interval = collection_interval
         self.collector_name = collector_name
+        self.collector_id = collector_id or collector_name
+        self.group = group
+        self.control_url = control_url
+        self.control_epoch = None
+        self.control_seq = None
+        self.spool = deque(maxlen=spool_size)
+        self.request_timeout = request_timeout
+        # Scheduling lag and skipped slots of the current cycle, set by
+        # CollectorScheduler and reported to the server with the next POST
+        self.schedule_report = None
+        self.running = False
+        self.paused = False
+        self._wakeup = threading.Event()
+        self._control_lock = threading.Lock()
         self.logger = logging.getLogger(f"{__name__}.{collector_name}")
+    
+    def _control_headers(self):
+        """Headers identifying this collector so commands can ride on ingest responses."""
+        if not self.control_url:
+            return {}
+        headers = {'X-Collector-Id': self.collector_id}
+        if self.group:
+            headers['X-Collector-Group'] = self.group
+        if self.control_epoch is not None:
+            headers['X-Control-Epoch'] = self.control_epoch
+        if self.control_seq is not None:
+            headers['X-Control-Seq'] = str(self.control_seq)
+        return headers
+    
+    def _post(self, data):
+        """POST one payload, applying any piggybacked commands. Returns True on success."""
+        self.logger.debug("Sending data to %s: %s", self.endpoint_url, truncate(data))
+        headers = {'Content-Type': 'application/json'}
+        headers.update(self._control_headers())
+        report, self.schedule_report = self.schedule_report, None
+        if report is not None:
+            headers['X-Schedule-Lag-Ms'] = f"{report[0] * 1000:.3f}"
+            headers['X-Schedule-Skipped'] = str(report[1])
+        response = requests.post(self.endpoint_url, json=data, headers=headers, timeout=self.request_timeout)
+        
+        if not response.ok:
+            self.logger.error("Error sending data: %s, %s", response.status_code, truncate(response.text))
+            return False
         
+        self.logger.info("Successfully sent data to %s", self.endpoint_url)
+        if self.control_url:
+            try:
+                control = response.json().get('control')
+            except ValueError:
+                control = None
+            if control:
+                self.apply_control(control)
+        return True
+    
     def send_data(self, data):
-        """Send data to the server endpoint."""
+        """Send data to the server endpoint, spooling it if the send fails."""
         try:
-            self.logger.debug(f"Sending data to {self.endpoint_url}: {json.dumps(data)}")
-            response = requests.post(
-                self.endpoint_url,
-                json=data,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code == 200:
-                self.logger.info(f"Successfully sent data to {self.endpoint_url}")
+            if self._post(data):
                 return True
-            else:
-                self.logger.error(f"Error sending data: {response.status_code}, {response.text}")
-                return False
         except Exception as e:
-            self.logger.error(f"Exception sending data: {e}")
-            return False
+            self.logger.error("Exception sending data: %s", e)
+        self.spool.append(data)
+        return False
+    
+    def flush_spool(self):
+        """Resend spooled payloads in order, stopping at the first failure."""
+        sent = 0
+        while self.spool:
+            data = self.spool.popleft()
+            try:
+                ok = self._post(data)
+            except Exception as e:
+                self.logger.error("Exception flushing spool: %s", e)
+                ok = False
+            if not ok:
+                self.spool.appendleft(data)
+                break
+            sent += 1
+        self.logger.info("Flushed %s spooled payloads, %s left", sent, len(self.spool))
+    
+    def apply_control(self, control):
+        """Apply a {'epoch', 'seq', 'stop', 'commands'} message from the control channel."""
+        # Commands can arrive both by long-poll and on an ingest response, so
+        # only apply each sequence number once
+        with self._control_lock:
+            epoch = control.get('epoch')
+            if epoch != self.control_epoch:
+                # The server restarted and numbers its commands from scratch;
+                # everything it sends is new
+                if self.control_epoch is not None:
+                    self.logger.info("Control channel restarted, resyncing")
+                self.control_epoch = epoch
+                self.control_seq = None
+            last_seq = self.control_seq
+            seq = control.get('seq')
+            if seq is not None and (last_seq is None or seq > last_seq):
+                self.control_seq = seq
+            commands = [entry for entry in control.get('commands', [])
+                        if last_seq is None or entry.get('seq', 0) > last_seq]
+        
+        # The server is in the STOP state, whether or not this collector saw
+        # the stop command itself
+        if control.get('stop') and self.running:
+            self.logger.info("Server is in the STOP state. Shutting down...")
+            self.running = False
+            self._wakeup.set()
+        
+        for entry in commands:
+            command = entry.get('command')
+            self.logger.info("Received %s command from server", command)
+            if command == 'stop':
+                self.running = False
+            elif command == 'pause':
+                self.paused = True
+            elif command == 'resume':
+                self.paused = False
+            elif command == 'set_interval':
+                self.collection_interval = entry['interval']
+                self.logger.info("Collection interval set to %s seconds", self.collection_interval)
+            elif command == 'flush_spool':
+                self.flush_spool()
+            else:
+                self.logger.warning("Ignoring unknown command: %s", command)
+        
+        # Wake the collection loop so the commands take effect immediately
+        if commands:
+            self._wakeup.set()
+    
+    def _listen_for_control(self):
+        """Hold a long-poll request open on the control channel while running."""
+        backoff = 1
+        while self.running:
+            params = {
+                'collector_id': self.collector_id,
+                'timeout': CONTROL_POLL_TIMEOUT
+            }
+            if self.group:
+                params['group'] = self.group
+            if self.control_epoch is not None:
+                params['epoch'] = self.control_epoch
+            if self.control_seq is not None:
+                params['since'] = self.control_seq
+            try:
+                response = requests.get(self.control_url, params=params, timeout=CONTROL_POLL_TIMEOUT + 10)
+                response.raise_for_status()
+                self.apply_control(response.json())
+                backoff = 1
+            except Exception as e:
+                self.logger.error("Error polling control channel: %s", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+    
+    def start_control_listener(self):
+        """Start the background long-poll thread for the control channel."""
+        thread = threading.Thread(
+            target=self._listen_for_control,
+            name=f"{self.collector_name}-control",
+            daemon=True
+        )
+        thread.start()
+        return thread
     
     def should_stop(self):
         """Check if the collector should stop running."""
         if not self.status_url:
             return False
-            
+        
         try:
             status_response = requests.get(self.status_url)
             if status_response.status_code == 200:
@@ -63,35 +225,237 @@ class CollectorBase:
                     self.logger.info("Received STOP command from server. Shutting down...")
                     return True
         except Exception as e:
-            self.logger.error(f"Error checking stop status: {e}")
+            self.logger.error("Error checking stop status: %s", e)
         
         return False
     
-    def run_collection_loop(self, collect_function):
+    def start(self, wakeup=None):
+        """
+        Mark the collector as running and connect it to the control channel.
+        
+        Args:
+            wakeup: Event to set when commands arrive (optional, defaults to
+                the collector's own event)
+        """
+        self.logger.info("Starting %s collection service, sending to: %s", self.collector_name, self.endpoint_url)
+        if wakeup is not None:
+            self._wakeup = wakeup
+        self.running = True
+        if self.control_url:
+            self.logger.info("Control channel: %s", self.control_url)
+            self.start_control_listener()
+        elif self.status_url:
+            self.logger.info("Status endpoint: %s", self.status_url)
+    
+    def collect_once(self, collect_function):
+        """Run one collection cycle unless stopped or paused."""
+        # Without a control channel fall back to polling the status endpoint
+        if not self.control_url and self.should_stop():
+            self.running = False
+            return
+        
+        if self.paused:
+            self.logger.debug("Collection paused, skipping cycle")
+            return
+        
+        # Collect and send data
+        data = collect_function()
+        if data:
+            self.send_data(data)
+    
+    def run_collection_loop(self, collect_function, overrun=OVERRUN_SKIP, jitter=0):
         """
         Run the collection loop with the provided collection function.
         
+        Collections run at a fixed rate of collection_interval regardless of
+        how long each cycle takes; see CollectorScheduler.
+        
         Args:
             collect_function: Function that collects the data to send
+            overrun: What to do when a cycle runs past the next deadline
+            jitter: Upper bound in seconds of the random start offset
         """
-        self.logger.info(f"Starting {self.collector_name} collection service, sending to: {self.endpoint_url}")
-        if self.status_url:
-            self.logger.info(f"Status endpoint: {self.status_url}")
-        
-        running = True
-        while running:
-            # Check if we should stop
-            if self.should_stop():
-                running = False
-                break
+        scheduler = CollectorScheduler()
+        scheduler.add(self, collect_function, overrun=overrun, jitter=jitter)
+        scheduler.run()
+
+class ScheduledCollector:
+    """Scheduling state of one collector inside a CollectorScheduler."""
+    
+    def __init__(self, collector, collect_function, overrun, phase):
+        self.collector = collector
+        self.collect_function = collect_function
+        self.overrun = overrun
+        self.phase = phase
+        self.interval = collector.collection_interval
+        self.next_deadline = None
+        self.in_flight = False
+        self.last_finished = None
+        self.runs = 0
+        self.skipped = 0
+        self.skipped_reported = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.last_duration = 0.0
+    
+    def stats(self):
+        """Scheduling lag and run counts in milliseconds."""
+        return {
+            'collector': self.collector.collector_name,
+            'interval': self.interval,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'last_lag_ms': round(self.last_lag * 1000, 3),
+            'max_lag_ms': round(self.max_lag * 1000, 3),
+            'mean_lag_ms': round(self.total_lag / self.runs * 1000, 3) if self.runs else 0.0,
+            'last_duration_ms': round(self.last_duration * 1000, 3)
+        }
+
+class CollectorScheduler:
+    """
+    Fixed-rate scheduler running several collectors in one process.
+    
+    Each collector gets a grid of deadlines ``start + phase + k * interval``,
+    so the period does not drift with the time spent collecting and
+    sending. Collections run on a worker pool, so a slow collector (e.g. one
+    HTTP request per stock symbol) does not delay the others. A collector
+    never runs concurrently with itself. When a cycle overruns its next
+    deadline, the ``skip`` policy drops the missed slots and waits for the
+    next one on the grid. The ``catch_up`` policy runs the missed slots back
+    to back, at most max_catch_up of them.
+    
+    The phase is a random offset in [0, jitter) seeded from the collector id,
+    so a fleet of hosts spreads its POSTs out while each host keeps a stable
+    period. Scheduling lag (actual start minus deadline) is tracked per
+    collector, logged every report_every runs and available from stats().
+    Each cycle's lag and skipped slots also go to the server with the
+    cycle's POST, which records them in its telemetry.
+    """
+    
+    def __init__(self, max_workers=None, report_every=60, max_catch_up=3):
+        self.max_workers = max_workers
+        self.report_every = report_every
+        self.max_catch_up = max_catch_up
+        self.jobs = []
+        self.stopped = False
+        self._wakeup = threading.Event()
+        self.logger = logging.getLogger(f"{__name__}.Scheduler")
+    
+    def add(self, collector, collect_function, overrun=OVERRUN_SKIP, jitter=0):
+        """
+        Add a collector to the schedule.
+        
+        Args:
+            collector: CollectorBase instance
+            collect_function: Function that collects the data to send
+            overrun: OVERRUN_SKIP or OVERRUN_CATCH_UP
+            jitter: Upper bound in seconds of the random start offset
+        """
+        if overrun not in (OVERRUN_SKIP, OVERRUN_CATCH_UP):
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        phase = random.Random(collector.collector_id).uniform(0, jitter) if jitter else 0.0
+        self.jobs.append(ScheduledCollector(collector, collect_function, overrun, phase))
+    
+    def stop(self):
+        """Ask the scheduler to return after the running collections finish."""
+        self.stopped = True
+        self._wakeup.set()
+    
+    def stats(self):
+        """Scheduling statistics for every collector."""
+        return [job.stats() for job in self.jobs]
+    
+    def _run_job(self, job):
+        start = time.monotonic()
+        try:
+            job.collector.collect_once(job.collect_function)
+        except Exception as e:
+            job.collector.logger.error("Exception in collection cycle: %s", e)
+        finally:
+            job.last_finished = time.monotonic()
+            job.last_duration = job.last_finished - start
+            job.in_flight = False
+            self._wakeup.set()
+    
+    def _record_lag(self, job, lag):
+        job.runs += 1
+        job.last_lag = lag
+        job.max_lag = max(job.max_lag, lag)
+        job.total_lag += lag
+        if self.report_every and job.runs % self.report_every == 0:
+            stats = job.stats()
+            self.logger.info("%s scheduling lag: last %s ms, mean %s ms, max %s ms, %s skipped",
+                             job.collector.collector_name, stats['last_lag_ms'], stats['mean_lag_ms'],
+                             stats['max_lag_ms'], stats['skipped'])
+    
+    def _dispatch(self, job, now, pool):
+        """Start the job if its deadline has passed, applying the overrun policy."""
+        # A set_interval command starts a new grid from now
+        if job.collector.collection_interval != job.interval:
+            job.interval = job.collector.collection_interval
+            job.next_deadline = now
+        
+        if job.next_deadline > now:
+            return
+        
+        if job.in_flight:
+            # Still running from an earlier slot; decided once it finishes
+            return
+        
+        missed = int((now - job.next_deadline) // job.interval)
+        if job.overrun == OVERRUN_SKIP:
+            skip = missed
+            if job.last_finished is not None and job.last_finished > job.next_deadline:
+                # The previous cycle overran this slot, wait for the next one
+                skip += 1
+        else:
+            skip = max(missed - self.max_catch_up, 0)
+        if skip:
+            job.skipped += skip
+            job.next_deadline += skip * job.interval
+            if job.next_deadline > now:
+                return
+        
+        lag = now - job.next_deadline
+        self._record_lag(job, lag)
+        job.collector.schedule_report = (lag, job.skipped - job.skipped_reported)
+        job.skipped_reported = job.skipped
+        job.next_deadline += job.interval
+        job.in_flight = True
+        pool.submit(self._run_job, job)
+    
+    def run(self):
+        """Run every added collector until all of them stop."""
+        for job in self.jobs:
+            job.collector.start(wakeup=self._wakeup)
+        
+        start = time.monotonic()
+        for job in self.jobs:
+            job.next_deadline = start + job.phase
+        
+        pool = ThreadPoolExecutor(max_workers=self.max_workers or len(self.jobs) or 1,
+                                  thread_name_prefix="collector")
+        try:
+            while not self.stopped:
+                self._wakeup.clear()
+                active = [job for job in self.jobs if job.collector.running or job.in_flight]
+                if not active:
+                    break
+                
+                now = time.monotonic()
+                for job in active:
+                    if job.collector.running:
+                        self._dispatch(job, now, pool)
                 
-            # Collect and send data
-            data = collect_function()
-            if data:
-                self.send_data(data)
-            
-            # Sleep until next collection
-            self.logger.info(f"Sleeping {self.collection_interval} seconds until next collection")
-            time.sleep(self.collection_interval)
-            
-        self.logger.info(f"{self.collector_name} collection service stopped") 
\ No newline at end of file
+                # Sleep until the earliest deadline, or until a collection
+                # finishes or a control command arrives
+                pending = [job.next_deadline for job in active
+                           if job.collector.running and not job.in_flight]
+                timeout = max(min(pending) - time.monotonic(), 0) if pending else None
+                self._wakeup.wait(timeout)
+        finally:
+            pool.shutdown(wait=True)
+            for job in self.jobs:
+                job.collector.running = False
+                job.collector.logger.info("%s collection service stopped", job.collector.collector_name)
@@ -0,0 +1,34 @@
+import logging
+
+from logging_utils import setup_logging
+from collector_utils import CollectorScheduler
+import metrics_populator
+import stock_metrics_populator
+
+logger = logging.getLogger(__name__)
+
+def main():
+    """Run system and stock metrics collection in one process."""
+    # Configure logging through the shared background writer; both
+    # populators write here
+    setup_logging('collectors.log')
+    logger.info("Computer ID: %s", metrics_populator.COMPUTER_ID)
+    scheduler = CollectorScheduler()
+    
+    # System metrics are cheap and frequent; spread hosts over the period
+    scheduler.add(metrics_populator.create_collector(), metrics_populator.gather_metrics, jitter=5)
+    
+    # A stock cycle makes one API request per symbol and may overrun its
+    # interval, in which case the missed slots are skipped
+    scheduler.add(stock_metrics_populator.create_collector(), stock_metrics_populator.gather_stock_metrics, jitter=10)
+    
+    logger.info("Starting system and stock metrics collection")
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+    for stats in scheduler.stats():
+        logger.info("Scheduling stats: %s", stats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import time
+import uuid
+import threading
+from collections import deque
+from datetime import datetime
+
+# Commands understood by CollectorBase
+COMMANDS = ('pause', 'resume', 'set_interval', 'flush_spool', 'stop')
+
+# Longest a collector may hold a long-poll request open, in seconds
+MAX_POLL_TIMEOUT = 60
+
+
+class ControlChannel:
+    """
+    Sequence-numbered command log for collectors.
+
+    Each published command gets the next sequence number and targets every
+    collector, one group, or one collector id. Collectors remember the last
+    sequence number they saw and ask for anything newer, either through a
+    long-poll request that blocks until a command arrives or piggybacked on
+    their ingest responses. Only the most recent ``history`` commands are
+    kept, so a collector that was away longer simply misses them.
+
+    Sequence numbers start over when the server restarts, so every response
+    carries the channel's epoch. A collector whose epoch or sequence number
+    is not from this instance gets every command it has, as all of them are
+    newer than anything it saw before.
+
+    Whether collectors should stop is also kept as state and sent with every
+    response, so a collector that first makes contact after the stop command
+    was published still stops.
+    """
+
+    def __init__(self, history=1000):
+        self.commands = deque(maxlen=history)
+        self.seq = 0
+        # Identifies this server instance
+        self.epoch = uuid.uuid4().hex[:12]
+        self.stopped = False
+        self.collectors = {}
+        self._cond = threading.Condition()
+
+    def publish(self, command, collector_id=None, group=None, interval=None):
+        """
+        Publish a command and wake up any waiting collectors.
+
+        Args:
+            command: One of COMMANDS
+            collector_id: Only deliver to this collector (optional)
+            group: Only deliver to collectors in this group (optional)
+            interval: New collection interval in seconds, for set_interval
+
+        Returns:
+            The published command as a dict
+        """
+        if command not in COMMANDS:
+            raise ValueError(f"Unknown command: {command}")
+        if command == 'set_interval':
+            if interval is None or float(interval) <= 0:
+                raise ValueError("set_interval needs a positive interval")
+            interval = float(interval)
+
+        with self._cond:
+            self.seq += 1
+            entry = {
+                'seq': self.seq,
+                'command': command,
+                'collector_id': collector_id,
+                'group': group,
+                'issued_at': datetime.now().isoformat()
+            }
+            if interval is not None:
+                entry['interval'] = interval
+            self.commands.append(entry)
+            self._cond.notify_all()
+        return entry
+
+    def set_stopped(self, stopped):
+        """Set the stop state, publishing a stop command when it is switched on."""
+        with self._cond:
+            changed = stopped != self.stopped
+            self.stopped = stopped
+            if stopped and changed:
+                self.publish('stop')
+
+    def _response(self, commands):
+        return {'epoch': self.epoch, 'seq': self.seq, 'stop': self.stopped, 'commands': commands}
+
+    @staticmethod
+    def _matches(entry, collector_id, group):
+        if entry['collector_id'] is not None and entry['collector_id'] != collector_id:
+            return False
+        if entry['group'] is not None and entry['group'] != group:
+            return False
+        return True
+
+    def _pending(self, collector_id, group, since):
+        # Commands are appended in sequence order, so walk back from the end
+        pending = []
+        for entry in reversed(self.commands):
+            if entry['seq'] <= since:
+                break
+            if self._matches(entry, collector_id, group):
+                pending.append(entry)
+        pending.reverse()
+        return pending
+
+    def _touch(self, collector_id, group, since, via):
+        self.collectors[collector_id] = {
+            'collector_id': collector_id,
+            'group': group,
+            'last_seq': since,
+            'last_seen': datetime.now().isoformat(),
+            'via': via
+        }
+
+    def poll(self, collector_id, group=None, since=None, epoch=None, timeout=0, via='poll'):
+        """
+        Return the commands for a collector newer than ``since``.
+
+        With a timeout the call blocks until a matching command is published
+        or the timeout expires. A collector that sends no ``since`` (first
+        contact) is only told the current sequence number. A ``since`` from
+        another epoch, or beyond the current sequence number (a collector
+        that does not send its epoch), dates from before a restart and is
+        treated as 0.
+
+        Returns:
+            {'epoch': server epoch, 'seq': latest sequence number,
+             'stop': current stop state, 'commands': [...]}
+        """
+        timeout = min(max(timeout, 0), MAX_POLL_TIMEOUT)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._touch(collector_id, group, since, via)
+            if since is None:
+                return self._response([])
+            if (epoch is not None and epoch != self.epoch) or since > self.seq:
+                since = 0
+            while True:
+                pending = self._pending(collector_id, group, since)
+                remaining = deadline - time.monotonic()
+                if pending or remaining <= 0:
+                    return self._response(pending)
+                self._cond.wait(remaining)
+
+    def recent_commands(self, limit=100):
+        """The most recently published commands, newest first."""
+        with self._cond:
+            return list(self.commands)[-limit:][::-1]
+
+    def list_collectors(self):
+        """Every collector that has contacted the server, with when and how."""
+        with self._cond:
+            return sorted(self.collectors.values(), key=lambda c: c['collector_id'])
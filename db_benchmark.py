@@ -0,0 +1,515 @@
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import shutil
+import sqlite3
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+import psutil
+
+from logging_utils import setup_logging
+import db_bulk
+import db_check
+import db_cleanup
+import clear_stock_data
+from telemetry import telemetry
+from db_stats import file_stats
+from db_schema import (
+    COLUMNS,
+    COUNT_KEYS,
+    COUNT_BACKFILL,
+    create_schema,
+    create_indexes,
+    drop_indexes,
+    create_count_triggers,
+    drop_count_triggers
+)
+
+# Define the base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Generated datasets are cached here, results are written here
+DATA_DIR = os.path.join(BASE_DIR, 'bench_data')
+RESULTS_DIR = os.path.join(BASE_DIR, 'bench_results')
+
+# Named dataset sizes, in total rows over both metrics tables
+SIZES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '50m': 50_000_000
+}
+
+# Timestamp format of the collectors' payloads (see metrics_populator.py),
+# used for every generated and posted row so they order correctly as text
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Generated data covers this many days up to the time of generation, and
+# the retention benchmark keeps the newest RETENTION_DAYS of it
+DATASET_DAYS = 14
+RETENTION_DAYS = 7
+
+GENERATE_BATCH_SIZE = 50000
+
+# A result this much slower than the baseline (by median) is a regression,
+# unless it is slower by less than MIN_REGRESSION_MS, which is noise
+DEFAULT_THRESHOLD = 0.2
+MIN_REGRESSION_MS = 1.0
+
+def parse_size(value):
+    """Parse a dataset size such as 10k, 1m, 50m or 250000."""
+    value = value.lower()
+    if value in SIZES:
+        return SIZES[value]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip('km')) * multiplier)
+
+def dataset_path(rows, hosts, symbols, seed):
+    return os.path.join(DATA_DIR, f"bench-{rows}-{hosts}h-{symbols}s-{seed}.db")
+
+def generate_dataset(path, rows, hosts, symbols, seed, days=DATASET_DAYS):
+    """
+    Build a synthetic metrics database.
+
+    Every host and every symbol gets the same number of rows, evenly spaced
+    over the ``days`` before the time of generation and interleaved in time
+    order as live ingest would write them. Values come from a seeded RNG, so
+    the same arguments always produce the same rows; only the timestamps
+    move with the generation time.
+
+    Args:
+        path: Database file to create
+        rows: Total rows over both tables
+        hosts: Number of distinct computer_id values
+        symbols: Number of distinct stock symbols
+        seed: RNG seed
+        days: Time span covered by the data
+
+    Returns:
+        The dataset description, also saved next to the database as JSON
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    per_series = max(rows // (hosts + symbols), 1)
+    step = timedelta(days=days) / per_series
+    anchor = datetime.now().replace(minute=0, second=0, microsecond=0)
+    first = anchor - step * per_series
+
+    host_ids = [f"host-{i:04d}" for i in range(hosts)]
+    symbol_ids = [f"SYM{i:03d}" for i in range(symbols)]
+    prices = [rng.uniform(10, 500) for _ in symbol_ids]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        # Scratch file until it is renamed into place, durability is not needed
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        create_schema(conn)
+        for table in COUNT_KEYS:
+            drop_indexes(conn, table)
+            drop_count_triggers(conn, table)
+        conn.commit()
+
+        inserts = {table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                   for table, columns in COLUMNS.items()}
+        laptop, stock = [], []
+
+        def flush():
+            conn.executemany(inserts['laptop_metrics'], laptop)
+            conn.executemany(inserts['stock_metrics'], stock)
+            conn.commit()
+            laptop.clear()
+            stock.clear()
+
+        for i in range(1, per_series + 1):
+            timestamp = (first + step * i).strftime(TIMESTAMP_FORMAT)
+            for host in host_ids:
+                laptop.append((host, round(rng.uniform(0, 100), 1), round(rng.uniform(0, 100), 1), timestamp))
+            for j, symbol in enumerate(symbol_ids):
+                change = rng.gauss(0, 0.5)
+                prices[j] = max(prices[j] * (1 + change / 100), 0.01)
+                stock.append((symbol, round(prices[j], 2), round(change, 3), timestamp))
+            if len(laptop) + len(stock) >= GENERATE_BATCH_SIZE:
+                flush()
+        flush()
+
+        # Counters and indexes are built once at the end, like a bulk load
+        for table in COUNT_KEYS:
+            conn.execute(f"DELETE FROM {table}_counts")
+            conn.execute(COUNT_BACKFILL[table])
+            create_indexes(conn, table)
+            create_count_triggers(conn, table)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+    info = {
+        'rows': rows,
+        'hosts': hosts,
+        'symbols': symbols,
+        'seed': seed,
+        'days': days,
+        'anchor': anchor.isoformat(),
+        'laptop_metrics_rows': per_series * hosts,
+        'stock_metrics_rows': per_series * symbols,
+        'generate_seconds': round(time.perf_counter() - started, 3),
+        'database_bytes': os.path.getsize(path)
+    }
+    with open(path + '.json', 'w') as f:
+        json.dump(info, f, indent=2)
+    logger.info("Generated %s in %.1f s", path, info['generate_seconds'])
+    return info
+
+def ensure_dataset(rows, hosts, symbols, seed, regenerate=False):
+    """Return (path, description) of a cached dataset, generating it if needed."""
+    path = dataset_path(rows, hosts, symbols, seed)
+    if not regenerate and os.path.exists(path) and os.path.exists(path + '.json'):
+        with open(path + '.json') as f:
+            return path, json.load(f)
+    logger.info("Generating %s rows for %s hosts and %s symbols (seed %s)", rows, hosts, symbols, seed)
+    return path, generate_dataset(path, rows, hosts, symbols, seed)
+
+def summarize(samples):
+    """Latency summary in milliseconds of a list of durations in seconds."""
+    ordered = sorted(samples)
+    return {
+        'n': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'median_ms': round(statistics.median(ordered) * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3)
+    }
+
+class Recorder:
+    """
+    Collects the results of one benchmark run.
+
+    While a case runs, every named SQL statement executed through the
+    telemetry helpers is recorded, so each result also shows the time spent
+    in each query. Process memory (RSS) is sampled after every case.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.process = psutil.Process()
+        self._queries = None
+        telemetry.add_query_listener(self._on_query)
+
+    def _on_query(self, cur, statement, sql, params, seconds):
+        if self._queries is not None:
+            self._queries[-1][statement] = self._queries[-1].get(statement, 0.0) + seconds
+
+    def run(self, name, fn, repeat=1, warmup=0, rows=None):
+        """
+        Time ``fn`` and store the summary under ``name``.
+
+        Args:
+            name: Result name
+            fn: Callable to time
+            repeat: Timed calls
+            warmup: Untimed calls made first
+            rows: Rows written per call, to report a rows/s throughput
+        """
+        for _ in range(warmup):
+            fn()
+        rss_before = self.process.memory_info().rss
+        samples = []
+        self._queries = []
+        try:
+            for _ in range(repeat):
+                self._queries.append({})
+                start = time.perf_counter()
+                fn()
+                samples.append(time.perf_counter() - start)
+            queries = self._queries
+        finally:
+            self._queries = None
+
+        result = summarize(samples)
+        statements = sorted({statement for call in queries for statement in call})
+        result['sql_median_ms'] = {
+            statement: round(statistics.median(call.get(statement, 0.0) for call in queries) * 1000, 3)
+            for statement in statements
+        }
+        if rows:
+            result['rows_per_second'] = round(rows * repeat / sum(samples), 1)
+        rss_after = self.process.memory_info().rss
+        result['rss_bytes'] = rss_after
+        result['rss_delta_bytes'] = rss_after - rss_before
+        self.results[name] = result
+        logger.info("%-40s median %10.3f ms  p95 %10.3f ms%s", name, result['median_ms'], result['p95_ms'],
+                    f"  {result['rows_per_second']:.0f} rows/s" if rows else '')
+        return result
+
+def checked_get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return response
+
+def checked_post(client, url, payload):
+    response = client.post(url, json=payload)
+    if response.status_code not in (200, 201):
+        raise RuntimeError(f"POST {url} returned {response.status_code}")
+    return response
+
+def query_cases(app, work_path, info):
+    """The endpoint queries to time, as (name, url) pairs."""
+    middle = info['laptop_metrics_rows'] // 2
+    with sqlite3.connect(work_path) as conn:
+        row = conn.execute(
+            "SELECT timestamp, id FROM laptop_metrics ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?", (middle,)
+        ).fetchone()
+    table = '/api/system_metrics/table?draw=1&length=25&order[0][column]=0&order[0][dir]=desc'
+    cases = [
+        ('latest_system_metric', '/api/metrics'),
+        ('latest_stock_metrics', '/api/stock_metrics'),
+        ('historical_system_metrics', '/api/historical/system_metrics'),
+        ('historical_stock_metrics', '/api/historical/stock_metrics'),
+        ('table_latest_list', '/api/system_metrics/table?limit=100'),
+        ('table_host_list', '/api/system_metrics/table?limit=100&computer_id=host-0000'),
+        ('table_first_page', table),
+        ('table_offset_page_middle', f"{table}&start={middle}"),
+        ('table_search_page', '/api/system_metrics/table?draw=1&length=25&search[value]=host-000'),
+        ('health_report', '/api/health/db')
+    ]
+    if row:
+        cursor = app.encode_table_cursor(row[0], row[1])
+        cases.append(('table_keyset_page_middle', f"{table}&cursor={cursor}"))
+    return cases
+
+def load_app(work_path):
+    """
+    Import app.py against the working copy.
+
+    The app creates its schema and opens its shards at import time, so the
+    database is chosen through the environment before the import; database.db
+    and the shard directory are never touched. The single-file layout is
+    always the one timed.
+    """
+    os.environ['METRICS_DATABASE_PATH'] = work_path
+    os.environ['METRICS_SHARD_COUNT'] = '0'
+    import app
+    # Already imported by an earlier run in this process
+    app.DATABASE_PATH = work_path
+    return app
+
+def run_suite(rows, hosts, symbols, seed, repeat=20, ingest_requests=500, bulk_rows=100000,
+              regenerate=False, keep_work=False):
+    """
+    Run every benchmark against a fresh copy of the dataset.
+
+    Args:
+        rows: Dataset size, total rows over both tables
+        hosts: Number of hosts in the dataset
+        symbols: Number of symbols in the dataset
+        seed: Dataset RNG seed
+        repeat: Timed calls per query benchmark
+        ingest_requests: POST requests per ingest benchmark
+        bulk_rows: Rows in the bulk import benchmark
+        regenerate: Rebuild the cached dataset
+        keep_work: Keep the working copy after the run
+
+    Returns:
+        The results as a JSON-serializable dict
+    """
+    path, info = ensure_dataset(rows, hosts, symbols, seed, regenerate)
+    work_path = os.path.join(DATA_DIR, 'work.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(work_path + suffix):
+            os.remove(work_path + suffix)
+    shutil.copyfile(path, work_path)
+    app = load_app(work_path)
+
+    client = app.app.test_client()
+    recorder = Recorder()
+    sizes = {'dataset': file_stats(work_path)}
+
+    try:
+        # Endpoint queries, read-only
+        for name, url in query_cases(app, work_path, info):
+            recorder.run(f"query.{name}", lambda url=url: checked_get(client, url), repeat=repeat, warmup=1)
+
+        # Ingest paths, with the payloads the collectors send
+        rng = random.Random(seed)
+        host_ids = [f"host-{i:04d}" for i in range(hosts)]
+        symbol_ids = [f"SYM{i:03d}" for i in range(symbols)]
+
+        def post_system_metrics():
+            checked_post(client, '/metrics', {
+                'computer_id': rng.choice(host_ids),
+                'cpu_usage': round(rng.uniform(0, 100), 1),
+                'memory_usage': round(rng.uniform(0, 100), 1)
+            })
+
+        def post_stock_metrics():
+            timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+            checked_post(client, '/stock_metrics', [{
+                'symbol': symbol,
+                'price': round(rng.uniform(10, 500), 2),
+                'change_percent': round(rng.gauss(0, 0.5), 3),
+                'timestamp': timestamp
+            } for symbol in symbol_ids])
+
+        recorder.run('ingest.system_metrics', post_system_metrics, repeat=ingest_requests, rows=1)
+        recorder.run('ingest.stock_metrics', post_stock_metrics, repeat=ingest_requests, rows=len(symbol_ids))
+
+        if bulk_rows:
+            csv_path = os.path.join(DATA_DIR, f"bulk-{bulk_rows}-{seed}.csv")
+            with open(csv_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS['laptop_metrics'])
+                start = datetime.fromisoformat(info['anchor'])
+                for i in range(bulk_rows):
+                    writer.writerow([host_ids[i % hosts], round(rng.uniform(0, 100), 1),
+                                     round(rng.uniform(0, 100), 1),
+                                     (start + timedelta(seconds=i)).strftime(TIMESTAMP_FORMAT)])
+            recorder.run('ingest.bulk_import_csv', lambda: db_bulk.import_file(
+                'laptop_metrics', csv_path, database=work_path, restart=True), rows=bulk_rows)
+            os.remove(csv_path)
+        sizes['after_ingest'] = file_stats(work_path)
+
+        # Retention and maintenance scripts, each run once on the same copy
+        days_to_keep = RETENTION_DAYS + (datetime.now() - datetime.fromisoformat(info['anchor'])).days
+        recorder.run('maintenance.check_database', lambda: db_check_report(work_path))
+        recorder.run('maintenance.cleanup_database', lambda: db_cleanup.cleanup_database(
+            days_to_keep=days_to_keep, database_path=work_path))
+        sizes['after_cleanup'] = file_stats(work_path)
+        recorder.run('maintenance.clear_stock_data', lambda: clear_stock_data.clear_stock_data(
+            database_path=work_path))
+        sizes['after_clear_stock_data'] = file_stats(work_path)
+    finally:
+        if not keep_work:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(work_path + suffix):
+                    os.remove(work_path + suffix)
+
+    return {
+        'meta': {
+            'generated_at': datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': repeat,
+            'ingest_requests': ingest_requests,
+            'bulk_rows': bulk_rows
+        },
+        'dataset': info,
+        'sizes': sizes,
+        'peak_rss_bytes': peak_rss(),
+        'results': recorder.results
+    }
+
+def db_check_report(path):
+    if db_check.check_database(database_path=path) is None:
+        raise RuntimeError("check_database failed")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare two runs by median latency.
+
+    Returns:
+        List of (name, baseline ms, current ms, ratio, regressed) for every
+        result present in both runs
+    """
+    comparison = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        regressed = ratio > 1 + threshold and result['median_ms'] - base['median_ms'] >= MIN_REGRESSION_MS
+        comparison.append((name, base['median_ms'], result['median_ms'], ratio, regressed))
+    return comparison
+
+def main():
+    # Configure logging through the shared background writer; the app and
+    # the maintenance scripts write here too
+    setup_logging('db_benchmark.log', backup_count=3, max_per_interval=0)
+    parser = argparse.ArgumentParser(description="Benchmark the storage layer on a synthetic dataset")
+    parser.add_argument('--size', default='10k', help="total rows: 10k, 1m, 50m or a number (default 10k)")
+    parser.add_argument('--hosts', type=int, default=50, help="distinct computer_id values (default 50)")
+    parser.add_argument('--symbols', type=int, default=20, help="distinct stock symbols (default 20)")
+    parser.add_argument('--seed', type=int, default=42, help="dataset RNG seed (default 42)")
+    parser.add_argument('--repeat', type=int, default=20, help="timed calls per query (default 20)")
+    parser.add_argument('--ingest-requests', type=int, default=500, help="requests per ingest benchmark")
+    parser.add_argument('--bulk-rows', type=int, default=100000, help="rows in the bulk import benchmark, 0 to skip")
+    parser.add_argument('--regenerate', action='store_true', help="rebuild the cached dataset")
+    parser.add_argument('--keep-work', action='store_true', help="keep the working copy of the dataset")
+    parser.add_argument('--output', help="results file (default bench_results/<size>-<time>.json)")
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown that counts as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    rows = parse_size(args.size)
+    if rows < args.hosts + args.symbols:
+        parser.error("--size must be at least --hosts + --symbols")
+
+    results = run_suite(rows, args.hosts, args.symbols, args.seed, repeat=args.repeat,
+                        ingest_requests=args.ingest_requests, bulk_rows=args.bulk_rows,
+                        regenerate=args.regenerate, keep_work=args.keep_work)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{args.size}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info("Results written to %s", output)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['dataset'].get('rows') != rows:
+        logger.warning("Baseline was run on %s rows, this run on %s", baseline['dataset'].get('rows'), rows)
+
+    regressions = 0
+    for name, before, after, ratio, regressed in compare_results(results, baseline, args.threshold):
+        regressions += regressed
+        logger.info("%-40s %10.3f ms -> %10.3f ms  x%.2f%s", name, before, after, ratio,
+                    "  REGRESSION" if regressed else "")
+    if regressions:
+        logger.warning("%s results are more than %.0f%% slower than %s", regressions, args.threshold * 100,
+                       args.baseline)
+        return 1
+    logger.info("No regressions against %s", args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
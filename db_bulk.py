@@ -0,0 +1,371 @@
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import itertools
+from datetime import datetime
+
+from logging_utils import setup_logging
+from sharding import configured_shard_count, metrics_database_paths
+from db_schema import (
+    COLUMNS,
+    create_schema,
+    create_indexes,
+    drop_indexes
+)
+
+# Parquet support is optional and needs pyarrow
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Define the base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_PATH = os.path.join(BASE_DIR, 'database.db')
+
+# Rows per transaction during import and per fetch during export
+DEFAULT_BATCH_SIZE = 50000
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+FORMAT_EXTENSIONS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.parquet': 'parquet'
+}
+
+# Columns stored as REAL, converted from text when importing CSV
+REAL_COLUMNS = {'cpu_usage', 'memory_usage', 'price', 'change_percent'}
+
+logger = logging.getLogger(__name__)
+
+# Import progress, committed in the same transaction as each batch of rows
+CHECKPOINT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS bulk_import_checkpoints (
+        source TEXT PRIMARY KEY,
+        table_name TEXT,
+        records INTEGER NOT NULL DEFAULT 0,
+        byte_offset INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP
+    )
+'''
+
+def detect_format(path, fmt=None):
+    """Return the file format, from the explicit argument or the file extension."""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of {path}, pass --format")
+    return FORMAT_EXTENSIONS[extension]
+
+def require_parquet():
+    if pyarrow is None:
+        raise RuntimeError("Parquet support needs pyarrow (pip install pyarrow)")
+
+def read_csv(path, skip_records):
+    """Yield (record, None) for each CSV row after the first skip_records."""
+    with open(path, newline='') as f:
+        for record in itertools.islice(csv.DictReader(f), skip_records, None):
+            yield record, None
+
+def read_ndjson(path, byte_offset):
+    """Yield (record, offset after record) for each JSON line from byte_offset."""
+    with open(path, 'rb') as f:
+        f.seek(byte_offset)
+        for line in iter(f.readline, b''):
+            line = line.strip()
+            if line:
+                yield json.loads(line), f.tell()
+
+def read_parquet(path, skip_records, batch_size):
+    """Yield (record, None) for each Parquet row after the first skip_records."""
+    require_parquet()
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        if skip_records >= batch.num_rows:
+            skip_records -= batch.num_rows
+            continue
+        for record in batch.slice(skip_records).to_pylist():
+            yield record, None
+        skip_records = 0
+
+def to_row(record, columns):
+    """Convert an input record to a tuple of column values."""
+    row = []
+    for column in columns:
+        value = record.get(column)
+        if value == '':
+            value = None
+        elif value is not None:
+            if column in REAL_COLUMNS:
+                value = float(value)
+            elif column == 'id':
+                value = int(value)
+            elif isinstance(value, datetime):
+                value = value.isoformat(sep=' ')
+        row.append(value)
+    return tuple(row)
+
+def import_file(table, path, fmt=None, database=DATABASE_PATH, batch_size=DEFAULT_BATCH_SIZE,
+                restart=False, keep_ids=False):
+    """
+    Stream a CSV, NDJSON or Parquet file into a metrics table.
+
+    Rows are inserted with executemany in transactions of batch_size rows,
+    with the table's secondary indexes dropped for the duration of the load
+    and rebuilt at the end. Each transaction also records how far into the
+    file it got, so an interrupted import picks up where it stopped when run
+    again with the same file.
+
+    The counter triggers stay in place, so the row counters remain exact
+    while the app keeps ingesting into the same database, and after an app
+    restart recreates the schema mid-import. Queries the dropped indexes
+    serve are slower until the import finishes.
+
+    Args:
+        table: laptop_metrics or stock_metrics
+        path: Input file
+        fmt: csv, ndjson or parquet (default: from the file extension)
+        database: Database file to load into
+        batch_size: Rows per transaction
+        restart: Ignore any checkpoint and import the whole file again
+        keep_ids: Keep the id column of the input instead of assigning new ids
+
+    Returns:
+        Number of rows inserted by this run
+    """
+    fmt = detect_format(path, fmt)
+    columns = (['id'] if keep_ids else []) + COLUMNS[table]
+    source = f"{os.path.abspath(path)}:{table}"
+
+    conn = sqlite3.connect(database)
+    try:
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -262144")  # 256 MB
+        create_schema(conn)
+        conn.execute(CHECKPOINT_TABLE)
+
+        if restart:
+            conn.execute("DELETE FROM bulk_import_checkpoints WHERE source = ?", (source,))
+        checkpoint = conn.execute(
+            "SELECT records, byte_offset, completed FROM bulk_import_checkpoints WHERE source = ?", (source,)
+        ).fetchone()
+        records, byte_offset, completed = checkpoint or (0, 0, 0)
+        conn.commit()
+
+        if completed:
+            logger.info("%s was already imported into %s (%s records), use --restart to import again",
+                        path, table, records)
+            return 0
+        if records:
+            logger.info("Resuming import of %s into %s after %s records", path, table, records)
+
+        if fmt == 'csv':
+            reader = read_csv(path, records)
+        elif fmt == 'ndjson':
+            reader = read_ndjson(path, byte_offset)
+        else:
+            reader = read_parquet(path, records, batch_size)
+
+        # Index builds are deferred until after the load
+        drop_indexes(conn, table)
+        conn.commit()
+
+        insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        inserted = 0
+        started = time.perf_counter()
+
+        def flush(batch, done=False):
+            conn.executemany(insert_sql, batch)
+            conn.execute('''
+                INSERT INTO bulk_import_checkpoints (source, table_name, records, byte_offset, completed, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(source) DO UPDATE SET
+                    records = excluded.records,
+                    byte_offset = excluded.byte_offset,
+                    completed = excluded.completed,
+                    updated_at = excluded.updated_at
+            ''', (source, table, records, byte_offset, 1 if done else 0, datetime.now()))
+            conn.commit()
+
+        try:
+            batch = []
+            for record, offset in reader:
+                batch.append(to_row(record, columns))
+                records += 1
+                if offset is not None:
+                    byte_offset = offset
+
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    inserted += len(batch)
+                    elapsed = time.perf_counter() - started
+                    logger.info("Imported %s rows into %s (%.0f rows/s)", inserted, table, inserted / elapsed)
+                    batch = []
+
+            flush(batch, done=True)
+            inserted += len(batch)
+        except BaseException:
+            # Rows of a batch whose checkpoint was not written must not be
+            # committed with the index rebuild, or a resume inserts them again
+            conn.rollback()
+            raise
+        finally:
+            logger.info("Rebuilding indexes on %s", table)
+            create_indexes(conn, table)
+            conn.commit()
+
+        elapsed = time.perf_counter() - started
+        logger.info("Imported %s rows from %s into %s in %.1f s (%.0f rows/s)",
+                    inserted, path, table, elapsed, inserted / elapsed if elapsed else 0)
+        return inserted
+    finally:
+        conn.close()
+
+def write_csv(out, columns, batches):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+
+def write_ndjson(out, columns, batches):
+    for rows in batches:
+        out.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+def write_parquet(path, columns, batches):
+    require_parquet()
+    types = {'id': pyarrow.int64()}
+    types.update({column: pyarrow.float64() for column in REAL_COLUMNS})
+    schema = pyarrow.schema([(column, types.get(column, pyarrow.string())) for column in columns])
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            # One row group per batch keeps memory bounded
+            data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+            writer.write_table(pyarrow.table(data, schema=schema))
+
+def export_table(table, path, fmt=None, database=DATABASE_PATH, since=None, until=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream a metrics table out to a CSV, NDJSON or Parquet file.
+
+    Rows are read in id order with fetchmany, so memory use does not grow
+    with the size of the table. The database is opened read-only. Shard
+    files are read one after the other, in index order: every shard hands
+    out ids from its own range, so the rows stay in id order.
+
+    Args:
+        table: laptop_metrics or stock_metrics
+        path: Output file, or - for stdout (CSV and NDJSON only)
+        fmt: csv, ndjson or parquet (default: from the file extension)
+        database: Database file to read, or a list of shard files
+        since: Only rows with timestamp >= since (optional)
+        until: Only rows with timestamp < until (optional)
+        batch_size: Rows fetched at a time
+
+    Returns:
+        Number of rows exported
+    """
+    fmt = detect_format(path, fmt) if path != '-' else (fmt or 'ndjson')
+    columns = ['id'] + COLUMNS[table]
+
+    where = []
+    params = []
+    if since:
+        where.append('timestamp >= ?')
+        params.append(since)
+    if until:
+        where.append('timestamp < ?')
+        params.append(until)
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY id'
+
+    databases = [database] if isinstance(database, str) else database
+    exported = 0
+    started = time.perf_counter()
+
+    def batches():
+        nonlocal exported
+        for database in databases:
+            conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+            try:
+                cursor = conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    exported += len(rows)
+                    yield rows
+            finally:
+                conn.close()
+
+    if fmt == 'parquet':
+        write_parquet(path, columns, batches())
+    else:
+        writer = write_csv if fmt == 'csv' else write_ndjson
+        if path == '-':
+            writer(sys.stdout, columns, batches())
+        else:
+            with open(path, 'w', newline='') as out:
+                writer(out, columns, batches())
+
+    elapsed = time.perf_counter() - started
+    logger.info("Exported %s rows from %s to %s in %.1f s", exported, table, path, elapsed)
+    return exported
+
+def main():
+    # Configure logging through the shared background writer
+    setup_logging('db_bulk.log', backup_count=3, max_per_interval=0)
+    parser = argparse.ArgumentParser(description="Bulk import and export of metrics data")
+    parser.add_argument('--database', help="Database file (default: the database the app stores the metrics "
+                                           "in; export reads every shard when METRICS_SHARD_COUNT is set)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Rows per batch")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    import_parser = subparsers.add_parser(
+        'import', help="Load a file into a table",
+        description="Load a file into a table. The table's indexes are dropped during the load and "
+                    "rebuilt at the end; the row counters stay exact, so this is safe while app.py "
+                    "is running, but its queries are slower until the import finishes.")
+    import_parser.add_argument('table', choices=sorted(COLUMNS))
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=FORMATS)
+    import_parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over")
+    import_parser.add_argument('--keep-ids', action='store_true', help="Keep the id column of the input")
+
+    export_parser = subparsers.add_parser('export', help="Write a table to a file")
+    export_parser.add_argument('table', choices=sorted(COLUMNS))
+    export_parser.add_argument('path', help="Output file, or - for stdout")
+    export_parser.add_argument('--format', choices=FORMATS)
+    export_parser.add_argument('--since', help="Only rows with timestamp >= SINCE")
+    export_parser.add_argument('--until', help="Only rows with timestamp < UNTIL")
+
+    args = parser.parse_args()
+    if args.action == 'import' and not args.database and configured_shard_count() > 0:
+        # Rows would have to be routed to their shards with ids from each
+        # shard's range, which only sharding.py does
+        parser.error("METRICS_SHARD_COUNT is set: import into a database file with --database, "
+                     "then copy it into a new shard directory with sharding.py")
+    try:
+        databases = metrics_database_paths(args.database)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.action == 'import':
+        import_file(args.table, args.path, args.format, databases[0], args.batch_size,
+                    restart=args.restart, keep_ids=args.keep_ids)
+    else:
+        export_table(args.table, args.path, args.format, databases, args.since, args.until,
+                     args.batch_size)
+
+if __name__ == "__main__":
+    main()
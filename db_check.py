@@ -1,91 +1,118 @@
 import os
-import sqlite3
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
+import argparse
+
+from logging_utils import setup_logging
+from db_stats import health_report
+from sharding import metrics_database_paths
 
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'db_check.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=3        # Keep 3 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def check_database():
-    """Check the database status and log information about tables and records."""
+def check_database(pages=False, verify=False, database_path=None):
+    """Log a health report of the database.
+    
+    Counts, time ranges and ingest lag come from the maintained counters, so
+    the default check is instant. Page usage and a COUNT(*) cross-check of
+    the counters are opt-in because they read the whole file.
+    
+    Args:
+        pages: Also report per-table page usage and fragmentation
+        verify: Also check the counters against COUNT(*)
+        database_path: Database to check instead of database.db
+    
+    Returns:
+        The report dict, or None if the database could not be read
+    """
     # Define the absolute path to the database
-    DATABASE_PATH = os.path.join(BASE_DIR, 'database.db')
+    DATABASE_PATH = database_path or os.path.join(BASE_DIR, 'database.db')
     
-    logger.info(f"Checking database at: {DATABASE_PATH}")
-    logger.info(f"Current working directory: {os.getcwd()}")
+    logger.info("Checking database at: %s", DATABASE_PATH)
     
     # Check if database file exists
     if not os.path.exists(DATABASE_PATH):
-        logger.error(f"Database file does not exist at {DATABASE_PATH}")
-        return
+        logger.error("Database file does not exist at %s", DATABASE_PATH)
+        return None
+    
+    try:
+        report = health_report(DATABASE_PATH, pages=pages, verify=verify)
+    except Exception as e:
+        logger.error("Error checking database: %s", e)
+        return None
+    
+    files = report['file']
+    logger.info("Database size: %s bytes, WAL: %s bytes", files['database_bytes'], files['wal_bytes'])
     
-    logger.info(f"Database file exists, size: {os.path.getsize(DATABASE_PATH)} bytes")
+    header = report['pages']
+    logger.info("Pages: %s x %s bytes, freelist: %s pages (%.2f%%), journal mode: %s",
+                header['page_count'], header['page_size'], header['freelist_pages'],
+                header['freelist_percent'], header['journal_mode'])
     
+    for table, stats in report['series'].items():
+        if stats is None:
+            logger.warning("No row counters for %s, start the app once to create them", table)
+            continue
+        logger.info("Number of records in %s: %s across %s series", table, stats['rows'], len(stats['series']))
+        for series in stats['series']:
+            logger.info("  %s=%s: %s rows, %s .. %s, ingest lag %ss", stats['key'], series[stats['key']],
+                        series['rows'], series['first_timestamp'], series['last_timestamp'],
+                        series['ingest_lag_seconds'])
+    
+    for table, coverage in report['indexes'].items():
+        if coverage['missing_indexes']:
+            logger.warning("Missing indexes on %s: %s", table, coverage['missing_indexes'])
+        if coverage['missing_count_triggers']:
+            logger.warning("Missing counter triggers on %s, row counters are stale: %s",
+                           table, coverage['missing_count_triggers'])
+    
+    if pages:
+        if report['btrees'] is None:
+            logger.warning("SQLite was built without dbstat, page usage is unavailable")
+        else:
+            for btree in report['btrees']:
+                logger.info("  %s: %s pages, %.2f%% full, %.2f%% fragmented", btree['name'], btree['pages'],
+                            btree['fill_percent'], btree['fragmentation_percent'])
+    
+    if verify:
+        for table, result in report['verify'].items():
+            if result['ok']:
+                logger.info("Row counters for %s match COUNT(*): %s", table, result['actual'])
+            else:
+                logger.error("Row counters for %s are off: counted %s, actual %s",
+                             table, result['counted'], result['actual'])
+    
+    logger.info("Health report took %.1f ms", report['elapsed_ms'])
+    return report
+
+def main():
+    # Configure logging through the shared background writer, without rate
+    # limiting: every line of the report has the same few message types
+    setup_logging('db_check.log', backup_count=3, max_per_interval=0)
+    parser = argparse.ArgumentParser(description="Report the health of the metrics database")
+    parser.add_argument('--pages', action='store_true',
+                        help="also report page usage and fragmentation per table (reads the whole file)")
+    parser.add_argument('--verify', action='store_true',
+                        help="also check the row counters against COUNT(*) (scans the metrics tables)")
+    parser.add_argument('--json', action='store_true',
+                        help="print the report as JSON (one report per shard file when sharded)")
+    args = parser.parse_args()
+    
+    # The database the app stores the metrics in, or each of its shards
     try:
-        # Connect to the database
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            
-            # Check tables
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-            tables = cursor.fetchall()
-            logger.info(f"Tables in database: {[table[0] for table in tables]}")
-            
-            # Check laptop_metrics records
-            cursor.execute("SELECT COUNT(*) FROM laptop_metrics;")
-            count = cursor.fetchone()[0]
-            logger.info(f"Number of records in laptop_metrics: {count}")
-            
-            if count > 0:
-                # Get the most recent record
-                cursor.execute("SELECT * FROM laptop_metrics ORDER BY id DESC LIMIT 1;")
-                latest = cursor.fetchone()
-                logger.info(f"Latest laptop_metrics record: {latest}")
-            
-            # Check stock_metrics records
-            cursor.execute("SELECT COUNT(*) FROM stock_metrics;")
-            count = cursor.fetchone()[0]
-            logger.info(f"Number of records in stock_metrics: {count}")
-            
-            if count > 0:
-                # Get the most recent records for each symbol
-                cursor.execute("""
-                    SELECT s1.* FROM stock_metrics s1
-                    JOIN (
-                        SELECT symbol, MAX(id) as max_id
-                        FROM stock_metrics
-                        GROUP BY symbol
-                    ) s2 ON s1.symbol = s2.symbol AND s1.id = s2.max_id;
-                """)
-                latest_stocks = cursor.fetchall()
-                logger.info(f"Latest stock_metrics records: {latest_stocks}")
+        paths = metrics_database_paths()
+    except ValueError as e:
+        logger.error("Cannot find the metrics database: %s", e)
+        return
     
-    except Exception as e:
-        logger.error(f"Error checking database: {e}")
+    logger.info("Starting database check")
+    reports = {path: check_database(pages=args.pages, verify=args.verify, database_path=path) for path in paths}
+    logger.info("Database check completed")
+    if args.json and None not in reports.values():
+        report = reports[paths[0]] if len(paths) == 1 else reports
+        print(json.dumps(report, indent=2, default=str))
 
 if __name__ == "__main__":
-    logger.info("Starting database check")
-    check_database()
-    logger.info("Database check completed") 
\ No newline at end of file
+    main()
@@ -1,52 +1,47 @@
 import os
 import sqlite3
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime, timedelta
 
+from logging_utils import setup_logging
+from sharding import metrics_database_paths
+
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'db_cleanup.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=3        # Keep 3 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-def cleanup_database(days_to_keep=7):
-    """Clean up old records from the database, keeping only the specified number of days."""
-    # Define the absolute path to the database
-    DATABASE_PATH = os.path.join(BASE_DIR, 'database.db')
-    
-    logger.info(f"Cleaning up database at: {DATABASE_PATH}")
+def cleanup_database(days_to_keep=7, database_path=None):
+    """Clean up old records from the database, keeping only the specified number of days.
     
-    # Check if database file exists
-    if not os.path.exists(DATABASE_PATH):
-        logger.error(f"Database file does not exist at {DATABASE_PATH}")
+    Without database_path this cleans the database the app stores the
+    metrics in, every shard of it when METRICS_SHARD_COUNT is set.
+    """
+    try:
+        paths = metrics_database_paths(database_path)
+    except ValueError as e:
+        logger.error("Cannot find the metrics database: %s", e)
         return
     
     # Calculate the cutoff date
     cutoff_date = datetime.now() - timedelta(days=days_to_keep)
     cutoff_str = cutoff_date.strftime("%Y-%m-%d %H:%M:%S")
     
+    for path in paths:
+        cleanup_file(path, cutoff_str)
+
+def cleanup_file(path, cutoff_str):
+    """Delete the records older than cutoff_str from one database file."""
+    logger.info("Cleaning up database at: %s", path)
+    
+    # Check if database file exists
+    if not os.path.exists(path):
+        logger.error("Database file does not exist at %s", path)
+        return
+    
     try:
         # Connect to the database
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with sqlite3.connect(path) as conn:
             cursor = conn.cursor()
             
             # Get counts before cleanup
@@ -75,19 +70,21 @@ def cleanup_database(days_to_keep=7):
             stock_count_after = cursor.fetchone()[0]
             
             # Log the results
-            logger.info(f"Deleted {laptop_deleted} records from laptop_metrics")
-            logger.info(f"Deleted {stock_deleted} records from stock_metrics")
-            logger.info(f"laptop_metrics: {laptop_count_before} -> {laptop_count_after}")
-            logger.info(f"stock_metrics: {stock_count_before} -> {stock_count_after}")
+            logger.info("Deleted %s records from laptop_metrics", laptop_deleted)
+            logger.info("Deleted %s records from stock_metrics", stock_deleted)
+            logger.info("laptop_metrics: %s -> %s", laptop_count_before, laptop_count_after)
+            logger.info("stock_metrics: %s -> %s", stock_count_before, stock_count_after)
             
             # Vacuum the database to reclaim space
             cursor.execute("VACUUM;")
             logger.info("Database vacuumed to reclaim space")
     
     except Exception as e:
-        logger.error(f"Error cleaning up database: {e}")
+        logger.error("Error cleaning up database: %s", e)
 
 if __name__ == "__main__":
+    # Configure logging through the shared background writer
+    setup_logging('db_cleanup.log', backup_count=3, max_per_interval=0)
     logger.info("Starting database cleanup")
     cleanup_database()
     logger.info("Database cleanup completed") 
\ No newline at end of file
@@ -0,0 +1,186 @@
+import sqlite3
+
+# Tables holding the collected metrics
+TABLES = {
+    'laptop_metrics': '''
+        CREATE TABLE IF NOT EXISTS laptop_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id TEXT,
+            cpu_usage REAL,
+            memory_usage REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    'stock_metrics': '''
+        CREATE TABLE IF NOT EXISTS stock_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            symbol TEXT,
+            price REAL,
+            change_percent REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
+}
+
+# Data columns of each table, in insert order (id is assigned by SQLite)
+COLUMNS = {
+    'laptop_metrics': ['computer_id', 'cpu_usage', 'memory_usage', 'timestamp'],
+    'stock_metrics': ['symbol', 'price', 'change_percent', 'timestamp']
+}
+
+# Secondary indexes per table; bulk loads drop and rebuild these
+INDEXES = {
+    'laptop_metrics': {
+        # Used by the server-side system metrics table
+        'idx_laptop_metrics_timestamp': '''
+            CREATE INDEX IF NOT EXISTS idx_laptop_metrics_timestamp
+            ON laptop_metrics (timestamp, id)
+        ''',
+        'idx_laptop_metrics_computer_id': '''
+            CREATE INDEX IF NOT EXISTS idx_laptop_metrics_computer_id
+            ON laptop_metrics (computer_id, id)
+        ''',
+        # Per-host time range, kept by the counter triggers
+        'idx_laptop_metrics_computer_timestamp': '''
+            CREATE INDEX IF NOT EXISTS idx_laptop_metrics_computer_timestamp
+            ON laptop_metrics (computer_id, timestamp)
+        '''
+    },
+    'stock_metrics': {
+        # Latest and historical values per symbol, and its time range
+        'idx_stock_metrics_symbol_timestamp': '''
+            CREATE INDEX IF NOT EXISTS idx_stock_metrics_symbol_timestamp
+            ON stock_metrics (symbol, timestamp)
+        '''
+    }
+}
+
+# Column each table's row counters are kept per: one series per host or
+# per symbol
+COUNT_KEYS = {
+    'laptop_metrics': 'computer_id',
+    'stock_metrics': 'symbol'
+}
+
+# Columns of the counter tables; older databases only have row_count
+COUNT_COLUMNS = ['row_count', 'first_timestamp', 'last_timestamp']
+
+def _count_table_sql(table, key):
+    return f'''
+        CREATE TABLE IF NOT EXISTS {table}_counts (
+            {key} TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            first_timestamp TIMESTAMP,
+            last_timestamp TIMESTAMP
+        )
+    '''
+
+def _count_backfill_sql(table, key):
+    return f'''
+        INSERT INTO {table}_counts ({key}, row_count, first_timestamp, last_timestamp)
+        SELECT COALESCE({key}, ''), COUNT(*), MIN(timestamp), MAX(timestamp)
+        FROM {table}
+        GROUP BY COALESCE({key}, '')
+    '''
+
+def _count_triggers_sql(table, key):
+    # On delete the time range is only recomputed when the deleted row was
+    # at its edge, using the (key, timestamp) index
+    return {
+        f'trg_{table}_count_insert': f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_counts ({key}, row_count, first_timestamp, last_timestamp)
+                VALUES (COALESCE(NEW.{key}, ''), 1, NEW.timestamp, NEW.timestamp)
+                ON CONFLICT({key}) DO UPDATE SET
+                    row_count = row_count + 1,
+                    first_timestamp = CASE WHEN first_timestamp IS NULL OR NEW.timestamp < first_timestamp
+                                           THEN NEW.timestamp ELSE first_timestamp END,
+                    last_timestamp = CASE WHEN last_timestamp IS NULL OR NEW.timestamp > last_timestamp
+                                          THEN NEW.timestamp ELSE last_timestamp END;
+            END
+        ''',
+        f'trg_{table}_count_delete': f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                UPDATE {table}_counts
+                SET row_count = row_count - 1,
+                    first_timestamp = CASE WHEN OLD.timestamp <= first_timestamp
+                        THEN (SELECT MIN(timestamp) FROM {table} WHERE {key} IS OLD.{key})
+                        ELSE first_timestamp END,
+                    last_timestamp = CASE WHEN OLD.timestamp >= last_timestamp
+                        THEN (SELECT MAX(timestamp) FROM {table} WHERE {key} IS OLD.{key})
+                        ELSE last_timestamp END
+                WHERE {key} = COALESCE(OLD.{key}, '');
+            END
+        '''
+    }
+
+# Per-series row counters and time ranges, kept up to date by triggers so
+# counts, ranges and ingest lag never need a scan of the metrics tables
+COUNT_TABLES = {table: _count_table_sql(table, key) for table, key in COUNT_KEYS.items()}
+COUNT_BACKFILL = {table: _count_backfill_sql(table, key) for table, key in COUNT_KEYS.items()}
+COUNT_TRIGGERS = {table: _count_triggers_sql(table, key) for table, key in COUNT_KEYS.items()}
+
+def table_exists(conn, name):
+    """Return True if a table with the given name exists."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name,)
+    ).fetchone() is not None
+
+def create_indexes(conn, table):
+    """Create the secondary indexes of a table."""
+    for sql in INDEXES[table].values():
+        conn.execute(sql)
+
+def drop_indexes(conn, table):
+    """Drop the secondary indexes of a table."""
+    for name in INDEXES[table]:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+def create_count_triggers(conn, table):
+    """Create the triggers that maintain a table's row counters."""
+    for sql in COUNT_TRIGGERS.get(table, {}).values():
+        conn.execute(sql)
+
+def drop_count_triggers(conn, table):
+    """Drop the triggers that maintain a table's row counters."""
+    for name in COUNT_TRIGGERS.get(table, {}):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+def _ensure_count_table(conn, table):
+    """Create or upgrade a counter table, backfilling it when its contents are incomplete."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table}_counts)")]
+    if columns and all(column in columns for column in COUNT_COLUMNS):
+        return
+    if columns:
+        # Older counter table without time ranges; rebuild it once
+        conn.execute(f"DROP TABLE {table}_counts")
+    conn.execute(COUNT_TABLES[table])
+    conn.execute(COUNT_BACKFILL[table])
+
+def create_schema(conn):
+    """Create or upgrade every table, index, counter table and trigger."""
+    # Run the DDL as one transaction so no insert slips between the trigger
+    # being dropped and recreated
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    
+    for sql in TABLES.values():
+        conn.execute(sql)
+    
+    for table in TABLES:
+        create_indexes(conn, table)
+        
+        if table in COUNT_TABLES:
+            _ensure_count_table(conn, table)
+            # Always recreate the triggers so their definitions stay current
+            drop_count_triggers(conn, table)
+            create_count_triggers(conn, table)
+
+def init_database(path):
+    """Open the database at path and make sure the schema exists."""
+    with sqlite3.connect(path) as conn:
+        create_schema(conn)
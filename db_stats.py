@@ -0,0 +1,203 @@
+import os
+import sqlite3
+from datetime import datetime
+
+from db_schema import INDEXES, COUNT_KEYS, COUNT_TRIGGERS, table_exists
+
+
+def open_readonly(path):
+    """Open the database at path read-only, so a health check can never write to it."""
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+
+def _parse_timestamp(value):
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def file_stats(path):
+    """Size in bytes of the database file and its WAL and shared-memory files."""
+    def size(name):
+        return os.path.getsize(name) if os.path.exists(name) else 0
+    return {
+        'path': path,
+        'database_bytes': size(path),
+        'wal_bytes': size(path + '-wal'),
+        'shm_bytes': size(path + '-shm')
+    }
+
+
+def page_stats(conn):
+    """Page size, page count and freelist size from the database header."""
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'freelist_pages': freelist,
+        'freelist_bytes': freelist * page_size,
+        'freelist_percent': round(100 * freelist / page_count, 2) if page_count else 0.0,
+        'journal_mode': conn.execute("PRAGMA journal_mode").fetchone()[0],
+        'auto_vacuum': conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    }
+
+
+def series_stats(conn, now=None):
+    """
+    Row counts, time ranges and ingest lag per series, read from the counters.
+
+    Only the small counter tables maintained by the db_schema triggers are
+    read, so this stays fast however large the metrics tables grow.
+
+    Returns:
+        Dict of table name to {'key', 'rows', 'series': [...]}, with None for
+        tables whose counter table does not exist yet
+    """
+    now = now or datetime.now()
+    result = {}
+    for table, key in COUNT_KEYS.items():
+        if not table_exists(conn, f"{table}_counts"):
+            result[table] = None
+            continue
+
+        series = []
+        for name, rows, first, last in conn.execute(f'''
+            SELECT {key}, row_count, first_timestamp, last_timestamp
+            FROM {table}_counts
+            WHERE row_count > 0
+            ORDER BY {key}
+        '''):
+            last_seen = _parse_timestamp(last)
+            series.append({
+                key: name,
+                'rows': rows,
+                'first_timestamp': first,
+                'last_timestamp': last,
+                'ingest_lag_seconds': round((now - last_seen).total_seconds(), 1) if last_seen else None
+            })
+        result[table] = {
+            'key': key,
+            'rows': sum(entry['rows'] for entry in series),
+            'series': series
+        }
+    return result
+
+
+def index_coverage(conn):
+    """
+    Expected indexes and counter triggers per table, and which are missing.
+
+    A missing counter trigger means the counters are no longer maintained,
+    e.g. after an interrupted bulk load.
+    """
+    present = {}
+    for kind, name, table in conn.execute("SELECT type, name, tbl_name FROM sqlite_master WHERE type IN ('index', 'trigger')"):
+        present.setdefault((kind, table), set()).add(name)
+    analyzed = {row[0] for row in conn.execute("SELECT DISTINCT tbl FROM sqlite_stat1")} \
+        if table_exists(conn, 'sqlite_stat1') else set()
+
+    result = {}
+    for table, indexes in INDEXES.items():
+        indexes_present = present.get(('index', table), set())
+        triggers_present = present.get(('trigger', table), set())
+        triggers = COUNT_TRIGGERS.get(table, {})
+        result[table] = {
+            'indexes': sorted(indexes_present),
+            'missing_indexes': sorted(set(indexes) - indexes_present),
+            'missing_count_triggers': sorted(set(triggers) - triggers_present),
+            'analyzed': table in analyzed
+        }
+    return result
+
+
+def btree_stats(conn):
+    """
+    Page usage and fragmentation of every table and index, from dbstat.
+
+    Fragmentation is the share of pages that do not directly follow the
+    previous page of the same b-tree, i.e. how far a scan has to seek. This
+    reads every page of the file, so it is only run on request.
+
+    Returns:
+        List of per-b-tree dicts, largest first, or None when SQLite was
+        built without the dbstat virtual table
+    """
+    try:
+        rows = conn.execute("SELECT name, pageno, unused, pgsize FROM dbstat ORDER BY name, path")
+    except sqlite3.OperationalError:
+        return None
+
+    stats = {}
+    previous = {}
+    for name, pageno, unused, pgsize in rows:
+        entry = stats.setdefault(name, {'name': name, 'pages': 0, 'bytes': 0, 'unused_bytes': 0, 'out_of_order': 0})
+        entry['pages'] += 1
+        entry['bytes'] += pgsize
+        entry['unused_bytes'] += unused
+        if name in previous and pageno != previous[name] + 1:
+            entry['out_of_order'] += 1
+        previous[name] = pageno
+
+    result = []
+    for entry in stats.values():
+        out_of_order = entry.pop('out_of_order')
+        entry['fill_percent'] = round(100 * (1 - entry['unused_bytes'] / entry['bytes']), 2) if entry['bytes'] else 0.0
+        entry['fragmentation_percent'] = round(100 * out_of_order / (entry['pages'] - 1), 2) if entry['pages'] > 1 else 0.0
+        result.append(entry)
+    result.sort(key=lambda entry: entry['bytes'], reverse=True)
+    return result
+
+
+def verify_counts(conn, series):
+    """
+    Compare the counters with COUNT(*) on the metrics tables.
+
+    This is the full scan the counters exist to avoid; only for checking
+    that they have not drifted.
+    """
+    result = {}
+    for table in COUNT_KEYS:
+        actual = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        counted = series[table]['rows'] if series.get(table) else None
+        result[table] = {'counted': counted, 'actual': actual, 'ok': counted == actual}
+    return result
+
+
+def health_report(path, pages=False, verify=False):
+    """
+    Build a health report of the database at path.
+
+    Without options every figure comes from the database header, the schema
+    and the counter tables, so the report is instant and does not compete
+    with ingest for the metrics tables.
+
+    Args:
+        path: Path of the SQLite database
+        pages: Also report per-table page usage and fragmentation (reads the whole file)
+        verify: Also check the counters against COUNT(*) (scans the metrics tables)
+
+    Returns:
+        The report as a JSON-serializable dict
+    """
+    started = datetime.now()
+    report = {'generated_at': started.isoformat(), 'file': file_stats(path)}
+
+    conn = open_readonly(path)
+    try:
+        report['pages'] = page_stats(conn)
+        report['series'] = series_stats(conn, now=started)
+        report['indexes'] = index_coverage(conn)
+        if pages:
+            report['btrees'] = btree_stats(conn)
+        if verify:
+            report['verify'] = verify_counts(conn, report['series'])
+    finally:
+        conn.close()
+
+    report['elapsed_ms'] = round((datetime.now() - started).total_seconds() * 1000, 3)
+    return report
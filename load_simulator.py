@@ -0,0 +1,650 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import logging
+import argparse
+import itertools
+import threading
+from datetime import datetime
+from urllib.parse import urljoin, urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from logging_utils import setup_logging
+from telemetry import LatencyHistogram
+from collector_utils import CollectorBase
+
+# Define the base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'bench_results')
+
+DEFAULT_URL = 'http://127.0.0.1:5001'
+
+# Periods of the simulated clients, matching metrics_populator.py and the
+# fetchAllMetrics polling in static/scripts/metrics.js
+SYSTEM_INTERVAL = 5
+STOCK_INTERVAL = 60
+DASHBOARD_INTERVAL = 10
+TABLE_REFRESH_INTERVAL = 50
+
+# App requests per cycle of each client kind; a dashboard cycle also
+# refreshes the table every TABLE_REFRESH_INTERVAL
+REQUESTS_PER_CYCLE = {
+    'system_collector': 1,
+    'stock_collector': 1,
+    'dashboard': 3 + DASHBOARD_INTERVAL / TABLE_REFRESH_INTERVAL
+}
+
+# Control channel group of the virtual collectors, so commands sent to them
+# never reach real collectors
+SYSTEM_GROUP = 'loadsim-system'
+STOCK_GROUP = 'loadsim-stock'
+
+# A step is saturated when any of these is exceeded
+DEFAULT_LATENCY_SLO_MS = 1000
+DEFAULT_MAX_ERROR_RATE = 0.01
+MIN_THROUGHPUT_RATIO = 0.9
+
+# Scheduling lag above this means the simulator itself cannot keep up, and
+# the step measures the client rather than the server
+CLIENT_LAG_LIMIT = 1.0
+
+
+class FinnhubStub:
+    """
+    Local HTTP server answering Finnhub /api/v1/quote requests.
+
+    Prices follow a seeded random walk per symbol and every response can be
+    delayed by a fixed latency, so stock collectors do realistic work without
+    touching the real API or its rate limits. Point a real
+    stock_metrics_populator.py at it with FINNHUB_BASE_URL in config.py.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, seed=0):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.prices = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != '/api/v1/quote':
+                    self.send_error(404)
+                    return
+                symbol = parse_qs(url.query).get('symbol', [''])[0]
+                body = json.dumps(stub.quote(symbol)).encode('utf-8')
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='finnhub-stub', daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def quote(self, symbol):
+        """Next quote of a symbol, in Finnhub's response format."""
+        with self._lock:
+            self.requests += 1
+            previous_close = self.prices.setdefault(symbol, round(self.rng.uniform(10, 500), 2))
+            current = max(round(previous_close * (1 + self.rng.gauss(0, 0.01)), 2), 0.01)
+            self.prices[symbol] = current
+        return {
+            'c': current,
+            'd': round(current - previous_close, 2),
+            'dp': round((current - previous_close) / previous_close * 100, 4),
+            'h': max(current, previous_close),
+            'l': min(current, previous_close),
+            'o': previous_close,
+            'pc': previous_close,
+            't': int(time.time())
+        }
+
+    def start(self):
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LoadStats:
+    """
+    Latency, errors and scheduling lag of one step, per request name.
+
+    Only requests and cycles starting inside the measurement window are
+    recorded; requests started in the window are kept even when they finish
+    after it, so slow responses are not lost from the tail.
+    """
+
+    def __init__(self):
+        self.latency = {}
+        self.errors = {}
+        self.lag = {}
+        self.dispatched = {}
+        self.skipped = {}
+        self.window = (float('inf'), float('inf'))
+        self._lock = threading.Lock()
+
+    def in_window(self, started):
+        return self.window[0] <= started < self.window[1]
+
+    def record(self, name, started, seconds, ok):
+        if not self.in_window(started):
+            return
+        with self._lock:
+            histogram = self.latency.get(name)
+            if histogram is None:
+                histogram = self.latency[name] = LatencyHistogram()
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        histogram.record(seconds)
+
+    def record_dispatch(self, kind, deadline, lag=None, skipped=False):
+        if not self.in_window(deadline):
+            return
+        with self._lock:
+            if skipped:
+                self.skipped[kind] = self.skipped.get(kind, 0) + 1
+                return
+            self.dispatched[kind] = self.dispatched.get(kind, 0) + 1
+            histogram = self.lag.get(kind)
+            if histogram is None:
+                histogram = self.lag[kind] = LatencyHistogram()
+        histogram.record(lag)
+
+    def timed(self, name, fn):
+        """Call fn(), recording its latency under name; fn returns True on success."""
+        started = time.monotonic()
+        try:
+            ok = fn()
+        except Exception:
+            ok = False
+        self.record(name, started, time.monotonic() - started, ok)
+        return ok
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class SimulatedClient:
+    """Schedule entry of one virtual collector or dashboard."""
+
+    def __init__(self, kind, interval, fn):
+        self.kind = kind
+        self.interval = interval
+        self.fn = fn
+        self.in_flight = False
+
+
+class LoadScheduler:
+    """
+    Fixed-rate dispatcher for many virtual clients.
+
+    Like CollectorScheduler, but built for thousands of clients: deadlines
+    are kept in a heap, and one dispatcher thread hands due clients to a
+    worker pool. A client whose previous cycle is still running skips its
+    slot. The lag between a deadline and the cycle actually starting is
+    recorded, which shows when the simulator itself is the bottleneck.
+    """
+
+    def __init__(self, stats, workers):
+        self.stats = stats
+        self.workers = workers
+        self.clients = []
+        self._seq = itertools.count()
+
+    def add(self, kind, interval, phase, fn):
+        """Add a client running fn every interval seconds, first after phase seconds."""
+        self.clients.append((phase, SimulatedClient(kind, interval, fn)))
+
+    def _run_client(self, client, deadline):
+        self.stats.record_dispatch(client.kind, deadline, lag=time.monotonic() - deadline)
+        try:
+            client.fn()
+        except Exception as e:
+            logger.error("Exception in simulated %s client: %s", client.kind, e)
+        finally:
+            client.in_flight = False
+
+    def run(self, warmup, duration):
+        """Run every client for warmup + duration seconds, recording only after the warmup."""
+        start = time.monotonic()
+        heap = [(start + phase, next(self._seq), client) for phase, client in self.clients]
+        heapq.heapify(heap)
+        end = start + warmup + duration
+        self.stats.window = (start + warmup, end)
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='loadsim')
+        try:
+            while heap:
+                deadline, _, client = heap[0]
+                if deadline >= end:
+                    time.sleep(max(end - time.monotonic(), 0))
+                    break
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    continue
+
+                heapq.heapreplace(heap, (deadline + client.interval, next(self._seq), client))
+                if client.in_flight:
+                    self.stats.record_dispatch(client.kind, deadline, skipped=True)
+                    continue
+                client.in_flight = True
+                pool.submit(self._run_client, client, deadline)
+        finally:
+            # Requests still running finish, but nothing queued starts any more
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def stock_payload(symbol, quote):
+    """Convert a Finnhub quote like stock_metrics_populator.fetch_stock_data does."""
+    if not quote.get('c') or quote['c'] <= 0:
+        return None
+    previous_close = quote['pc']
+    change_percent = ((quote['c'] - previous_close) / previous_close) * 100 if previous_close > 0 else 0
+    return {
+        'symbol': symbol,
+        'price': quote['c'],
+        'change_percent': round(change_percent, 2),
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def add_system_collector(scheduler, stats, base_url, index, timeout, long_poll):
+    """Add a virtual host posting like metrics_populator.py."""
+    collector_id = f"loadsim-host-{index:05d}"
+    collector = CollectorBase(
+        endpoint_url=urljoin(base_url, '/metrics'),
+        collection_interval=SYSTEM_INTERVAL,
+        collector_name='LoadSimSystem',
+        collector_id=collector_id,
+        group=SYSTEM_GROUP,
+        control_url=urljoin(base_url, '/api/control/poll'),
+        spool_size=10,
+        request_timeout=timeout
+    )
+    if long_poll:
+        collector.start()
+    rng = random.Random(collector_id)
+
+    def collect():
+        if collector.paused:
+            return
+        payload = {
+            'computer_id': collector_id,
+            'cpu_usage': round(rng.uniform(0, 100), 1),
+            'memory_usage': round(rng.uniform(0, 100), 1),
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        stats.timed('POST /metrics', lambda: collector.send_data(payload))
+
+    scheduler.add('system_collector', SYSTEM_INTERVAL, rng.uniform(0, SYSTEM_INTERVAL), collect)
+    return collector
+
+
+def add_stock_collector(scheduler, stats, base_url, finnhub_url, index, symbols, timeout):
+    """Add a virtual stock collector: one quote request per symbol, then one POST."""
+    collector_id = f"loadsim-stock-{index:03d}"
+    collector = CollectorBase(
+        endpoint_url=urljoin(base_url, '/stock_metrics'),
+        collection_interval=STOCK_INTERVAL,
+        collector_name='LoadSimStock',
+        collector_id=collector_id,
+        group=STOCK_GROUP,
+        control_url=urljoin(base_url, '/api/control/poll'),
+        spool_size=10,
+        request_timeout=timeout
+    )
+    session = requests.Session()
+
+    def fetch_quote(symbol, results):
+        response = session.get(f"{finnhub_url}/api/v1/quote", params={'symbol': symbol, 'token': 'loadsim'},
+                               timeout=timeout)
+        if response.ok:
+            payload = stock_payload(symbol, response.json())
+            if payload:
+                results.append(payload)
+                return True
+        return False
+
+    def collect():
+        if collector.paused:
+            return
+        results = []
+        for symbol in symbols:
+            stats.timed('GET finnhub quote', lambda: fetch_quote(symbol, results))
+        if results:
+            stats.timed('POST /stock_metrics', lambda: collector.send_data(results))
+
+    rng = random.Random(collector_id)
+    scheduler.add('stock_collector', STOCK_INTERVAL, rng.uniform(0, STOCK_INTERVAL), collect)
+    return collector
+
+
+def add_dashboard(scheduler, stats, base_url, index, timeout):
+    """Add a virtual browser tab replaying the dashboard's polling."""
+    session = requests.Session()
+    state = {'loaded': False, 'draw': 0, 'last_table_refresh': None}
+
+    def get(name, path, params=None):
+        def call():
+            return session.get(urljoin(base_url, path), params=params, timeout=timeout).ok
+        stats.timed(f"GET {name}", call)
+
+    def table_page():
+        # First page of the server-side DataTable, as sent by fetchSystemMetricsPage
+        state['draw'] += 1
+        get('/api/system_metrics/table', '/api/system_metrics/table', {
+            'draw': state['draw'],
+            'start': 0,
+            'length': 10,
+            'search[value]': '',
+            'order[0][column]': 0,
+            'order[0][dir]': 'desc'
+        })
+
+    def cycle():
+        if not state['loaded']:
+            # Page load: the page itself, the table and the stock charts
+            get('/metrics (page)', '/metrics')
+            table_page()
+            get('/api/historical/stock_metrics', '/api/historical/stock_metrics')
+            state['loaded'] = True
+
+        # fetchAllMetrics
+        get('/api/metrics', '/api/metrics')
+        get('/api/stock_metrics', '/api/stock_metrics')
+        get('/api/historical/stock_metrics', '/api/historical/stock_metrics')
+        now = time.monotonic()
+        if state['last_table_refresh'] is None or now - state['last_table_refresh'] > TABLE_REFRESH_INTERVAL:
+            table_page()
+            state['last_table_refresh'] = now
+
+    phase = random.Random(f"dashboard-{index}").uniform(0, DASHBOARD_INTERVAL)
+    scheduler.add('dashboard', DASHBOARD_INTERVAL, phase, cycle)
+
+
+def offered_requests(stats):
+    """
+    App requests the cycles due inside the measured window should have sent.
+
+    Counted from the deadlines actually scheduled in the window, run or
+    skipped, so clients whose period is longer than the window are not
+    expected to have sent anything.
+    """
+    return sum((stats.dispatched.get(kind, 0) + stats.skipped.get(kind, 0)) * per_cycle
+               for kind, per_cycle in REQUESTS_PER_CYCLE.items())
+
+
+def stop_virtual_collectors(base_url, timeout):
+    """End the long-polls of the virtual collectors with a stop command to their group."""
+    for group in (SYSTEM_GROUP, STOCK_GROUP):
+        try:
+            requests.post(urljoin(base_url, '/api/control/commands'),
+                          json={'command': 'stop', 'group': group}, timeout=timeout)
+        except requests.RequestException as e:
+            logger.warning("Could not stop virtual collectors of %s: %s", group, e)
+
+
+def run_step(base_url, finnhub_url, collectors, dashboards, stock_collectors=1, symbols=(),
+             warmup=10, duration=60, workers=256, timeout=10, long_poll=False,
+             latency_slo_ms=DEFAULT_LATENCY_SLO_MS, max_error_rate=DEFAULT_MAX_ERROR_RATE):
+    """
+    Run one load configuration and report how the server coped.
+
+    Args:
+        base_url: URL of the running app
+        finnhub_url: URL of the Finnhub stub
+        collectors: Virtual hosts posting system metrics
+        dashboards: Virtual browser tabs polling the dashboard
+        stock_collectors: Virtual stock collectors
+        symbols: Symbols every stock collector fetches
+        warmup: Seconds run before measuring
+        duration: Seconds measured
+        workers: Client threads sending requests
+        timeout: Request timeout in seconds
+        long_poll: Also hold a control channel long-poll open per virtual host
+        latency_slo_ms: p99 latency above which the step counts as saturated
+        max_error_rate: Error rate above which the step counts as saturated
+
+    Returns:
+        The step report as a dict
+    """
+    stats = LoadStats()
+    scheduler = LoadScheduler(stats, workers)
+    for index in range(collectors):
+        add_system_collector(scheduler, stats, base_url, index, timeout, long_poll)
+    for index in range(stock_collectors):
+        add_stock_collector(scheduler, stats, base_url, finnhub_url, index, symbols, timeout)
+    for index in range(dashboards):
+        add_dashboard(scheduler, stats, base_url, index, timeout)
+
+    logger.info("Step: %s collectors, %s stock collectors, %s dashboards for %s s (+%s s warmup)",
+                collectors, stock_collectors, dashboards, duration, warmup)
+    try:
+        scheduler.run(warmup, duration)
+    finally:
+        if long_poll:
+            stop_virtual_collectors(base_url, timeout)
+
+    endpoints = {}
+    total = errors = 0
+    app_requests = 0
+    for name, histogram in sorted(stats.latency.items()):
+        summary = histogram.summary()
+        failed = stats.errors.get(name, 0)
+        total += summary['count']
+        errors += failed
+        if 'finnhub' not in name:
+            app_requests += summary['count']
+        endpoints[name] = {
+            'requests': summary['count'],
+            'errors': failed,
+            'error_rate': round(failed / summary['count'], 4) if summary['count'] else 0.0,
+            'requests_per_second': round(summary['count'] / duration, 2),
+            'p50_ms': _ms(summary['p50']),
+            'p90_ms': _ms(summary['p90']),
+            'p99_ms': _ms(summary['p99']),
+            'max_ms': _ms(summary['max'])
+        }
+
+    client = {}
+    for kind in sorted(set(stats.lag) | set(stats.skipped)):
+        summary = stats.lag[kind].summary() if kind in stats.lag else {'p99': 0.0, 'max': 0.0}
+        client[kind] = {
+            'cycles': stats.dispatched.get(kind, 0),
+            'skipped': stats.skipped.get(kind, 0),
+            'lag_p99_ms': _ms(summary['p99']),
+            'lag_max_ms': _ms(summary['max'])
+        }
+
+    offered = offered_requests(stats) / duration
+    achieved = app_requests / duration
+    error_rate = errors / total if total else 0.0
+    worst_p99 = max((entry['p99_ms'] for name, entry in endpoints.items() if 'finnhub' not in name), default=0.0)
+
+    reasons = []
+    if error_rate > max_error_rate:
+        reasons.append(f"error rate {error_rate:.2%} above {max_error_rate:.2%}")
+    if worst_p99 > latency_slo_ms:
+        reasons.append(f"p99 latency {worst_p99:.0f} ms above {latency_slo_ms} ms")
+    if offered and achieved < offered * MIN_THROUGHPUT_RATIO:
+        reasons.append(f"throughput {achieved:.1f} req/s below offered {offered:.1f} req/s")
+    skipped = sum(entry['skipped'] for entry in client.values())
+    if skipped:
+        reasons.append(f"{skipped} client cycles skipped because the previous one was still waiting")
+    client_bound = any(entry['lag_p99_ms'] > CLIENT_LAG_LIMIT * 1000 for entry in client.values())
+    if client_bound:
+        logger.warning("The simulator fell behind its schedule; add --workers or spread the load over more machines")
+
+    report = {
+        'config': {
+            'collectors': collectors,
+            'stock_collectors': stock_collectors,
+            'symbols': len(symbols),
+            'dashboards': dashboards,
+            'warmup': warmup,
+            'duration': duration,
+            'workers': workers,
+            'long_poll': long_poll
+        },
+        'offered_requests_per_second': round(offered, 2),
+        'achieved_requests_per_second': round(achieved, 2),
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(error_rate, 4),
+        'worst_p99_ms': worst_p99,
+        'endpoints': endpoints,
+        'client': client,
+        'client_bound': client_bound,
+        'saturated': bool(reasons),
+        'saturation_reasons': reasons
+    }
+
+    logger.info("  offered %.1f req/s, achieved %.1f req/s, errors %.2f%%, worst p99 %.1f ms%s",
+                offered, achieved, error_rate * 100, worst_p99, "  SATURATED" if reasons else "")
+    for name, entry in endpoints.items():
+        logger.info("  %-36s %8d req %7.1f req/s  p50 %8.1f  p99 %8.1f  max %8.1f ms  errors %d", name,
+                    entry['requests'], entry['requests_per_second'], entry['p50_ms'], entry['p99_ms'],
+                    entry['max_ms'], entry['errors'])
+    for reason in reasons:
+        logger.info("  saturated: %s", reason)
+    return report
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(',') if count.strip()]
+
+
+def main():
+    # Configure logging through the shared background writer
+    setup_logging('load_simulator.log', max_per_interval=0)
+    parser = argparse.ArgumentParser(
+        description="Simulate a fleet of collectors and dashboards against a running app.py "
+                    "and find the load at which it saturates")
+    parser.add_argument('--url', default=DEFAULT_URL, help=f"app URL (default {DEFAULT_URL})")
+    parser.add_argument('--collectors', type=parse_counts, default=[100, 500, 1000, 2000],
+                        help="comma-separated virtual host counts to step through (default 100,500,1000,2000)")
+    parser.add_argument('--dashboards', type=parse_counts, default=[10],
+                        help="comma-separated open dashboard counts (default 10)")
+    parser.add_argument('--stock-collectors', type=int, default=1, help="virtual stock collectors (default 1)")
+    parser.add_argument('--symbols', default='AAPL,MSFT,GOOGL,AMZN,META,TSLA,NVDA,JPM,V,WMT',
+                        help="symbols each stock collector fetches")
+    parser.add_argument('--finnhub-latency', type=float, default=50,
+                        help="delay of each Finnhub stub response in ms (default 50)")
+    parser.add_argument('--warmup', type=float, default=10, help="seconds before measuring each step (default 10)")
+    parser.add_argument('--duration', type=float, default=60, help="seconds measured per step (default 60)")
+    parser.add_argument('--workers', type=int, default=256, help="client threads (default 256)")
+    parser.add_argument('--timeout', type=float, default=10, help="request timeout in seconds (default 10)")
+    parser.add_argument('--long-poll', action='store_true',
+                        help="hold a control channel long-poll open per virtual host, like real collectors")
+    parser.add_argument('--latency-slo', type=float, default=DEFAULT_LATENCY_SLO_MS,
+                        help=f"p99 latency in ms that counts as saturated (default {DEFAULT_LATENCY_SLO_MS})")
+    parser.add_argument('--max-error-rate', type=float, default=DEFAULT_MAX_ERROR_RATE,
+                        help=f"error rate that counts as saturated (default {DEFAULT_MAX_ERROR_RATE})")
+    parser.add_argument('--keep-going', action='store_true',
+                        help="run the larger collector counts after a step saturates")
+    parser.add_argument('--serve-finnhub', type=int, metavar='PORT',
+                        help="only run the Finnhub stub on PORT, for real stock collectors")
+    parser.add_argument('--output', help="results file (default bench_results/load-<time>.json)")
+    args = parser.parse_args()
+
+    # Every virtual request would otherwise log a line per send
+    logging.getLogger('collector_utils').setLevel(logging.WARNING)
+
+    stub = FinnhubStub(port=args.serve_finnhub or 0, latency=args.finnhub_latency / 1000)
+    finnhub_url = stub.start()
+    if args.serve_finnhub:
+        logger.info("Finnhub stub listening on %s, set FINNHUB_BASE_URL to it in config.py", finnhub_url)
+        try:
+            stub.thread.join()
+        except KeyboardInterrupt:
+            stub.stop()
+        return 0
+
+    try:
+        requests.get(urljoin(args.url, '/api/metrics/status'), timeout=args.timeout).raise_for_status()
+    except requests.RequestException as e:
+        logger.error("The app is not reachable at %s, start app.py first: %s", args.url, e)
+        return 1
+
+    symbols = [symbol.strip() for symbol in args.symbols.split(',') if symbol.strip()]
+    steps = []
+    saturation = []
+    try:
+        for dashboards in args.dashboards:
+            last_healthy = None
+            for collectors in sorted(args.collectors):
+                report = run_step(args.url, finnhub_url, collectors, dashboards,
+                                  stock_collectors=args.stock_collectors, symbols=symbols,
+                                  warmup=args.warmup, duration=args.duration, workers=args.workers,
+                                  timeout=args.timeout, long_poll=args.long_poll,
+                                  latency_slo_ms=args.latency_slo, max_error_rate=args.max_error_rate)
+                steps.append(report)
+                if not report['saturated']:
+                    last_healthy = report
+                    continue
+                if not args.keep_going:
+                    break
+            saturation.append({
+                'dashboards': dashboards,
+                'max_healthy_collectors': last_healthy['config']['collectors'] if last_healthy else None,
+                'max_healthy_requests_per_second': last_healthy['achieved_requests_per_second'] if last_healthy else None,
+                'saturated_at_collectors': next((step['config']['collectors'] for step in steps
+                                                 if step['config']['dashboards'] == dashboards and step['saturated']),
+                                                None)
+            })
+    except KeyboardInterrupt:
+        logger.warning("Interrupted, reporting the steps completed so far")
+    finally:
+        stub.stop()
+
+    for entry in saturation:
+        if entry['saturated_at_collectors'] is None:
+            logger.info("With %s dashboards: no saturation up to %s collectors", entry['dashboards'],
+                        entry['max_healthy_collectors'])
+        else:
+            logger.info("With %s dashboards: healthy up to %s collectors (%s req/s), saturated at %s",
+                        entry['dashboards'], entry['max_healthy_collectors'],
+                        entry['max_healthy_requests_per_second'], entry['saturated_at_collectors'])
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'meta': {'generated_at': datetime.now().isoformat(), 'url': args.url},
+            'steps': steps,
+            'saturation': saturation
+        }, f, indent=2)
+    logger.info("Results written to %s", output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import tempfile
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+
+# Define the base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOGS_DIR = os.path.join(BASE_DIR, 'logs')
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Records waiting for the background writer; beyond this they are dropped
+# rather than blocking the caller
+DEFAULT_QUEUE_SIZE = 10000
+
+# Default length at which logged payloads are cut off
+DEFAULT_PAYLOAD_LIMIT = 200
+
+# The listener started by setup_logging, if any
+_listener = None
+
+
+class Truncated:
+    """Lazily rendered, length-limited view of a value for log messages.
+
+    The repr is only built when the record is actually formatted, so a
+    payload passed to a suppressed or filtered record costs nothing.
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=DEFAULT_PAYLOAD_LIMIT):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+
+def truncate(value, limit=DEFAULT_PAYLOAD_LIMIT):
+    """Wrap a value so it is logged lazily and cut off after limit characters."""
+    return Truncated(value, limit)
+
+
+class RateLimitFilter(logging.Filter):
+    """Rate limit and sample log records per message type.
+
+    A message type is the name given with ``extra={'msg_type': ...}``, or
+    else the logger name plus the unformatted message template, so lazily
+    formatted calls such as ``logger.info("Got %s", x)`` share one budget
+    regardless of their arguments. At most ``max_per_interval`` records of
+    each type pass per ``interval`` seconds; the first record let through
+    after a suppression notes how many were dropped. ``sample_every`` maps a
+    named message type to N to keep only every Nth record of that type, so
+    editing the message text does not silently stop the sampling.
+    Warnings and errors are never filtered.
+    """
+
+    def __init__(self, max_per_interval=20, interval=60.0, sample_every=None):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval = interval
+        self.sample_every = sample_every or {}
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+
+        msg_type = getattr(record, 'msg_type', None)
+        key = msg_type or (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                # [window start, passed in window, suppressed, seen]
+                state = self._state[key] = [now, 0, 0, 0]
+            state[3] += 1
+
+            every = self.sample_every.get(msg_type) if msg_type else None
+            if every and (state[3] - 1) % every:
+                return False
+
+            if now - state[0] >= self.interval:
+                state[0] = now
+                state[1] = 0
+            if self.max_per_interval and state[1] >= self.max_per_interval:
+                state[2] += 1
+                return False
+
+            state[1] += 1
+            suppressed = state[2]
+            state[2] = 0
+
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """QueueHandler that defers formatting to the listener thread.
+
+    The stock QueueHandler formats every record on the calling thread before
+    enqueueing it. Here the record is passed through as-is so the message is
+    only built by the background writer; arguments must therefore not be
+    mutated after the logging call. Exceptions are rendered up front since
+    the traceback would otherwise keep the caller's frames alive.
+    When the queue is full the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(log_file, max_bytes=1024*1024, backup_count=5, level=logging.INFO,
+                  max_per_interval=20, interval=60.0, sample_every=None,
+                  queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Route all logging through a background writer thread.
+
+    Replaces any handlers on the root logger with a single non-blocking
+    queue handler. A listener thread drains the queue into a rotating file
+    in the logs directory and the console, and is flushed at exit.
+
+    Args:
+        log_file: Name of the log file inside the logs directory
+        max_bytes: Size at which the log file is rotated
+        backup_count: Number of rotated files to keep
+        level: Root logger level
+        max_per_interval: Records allowed per message type per interval (0 disables)
+        interval: Rate limiting window in seconds
+        sample_every: Mapping of msg_type name to N, keeping every Nth record
+        queue_size: Maximum number of records waiting to be written
+
+    Returns:
+        The running QueueListener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    # Create a logs directory if it doesn't exist
+    if not os.path.exists(LOGS_DIR):
+        os.makedirs(LOGS_DIR)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(
+        os.path.join(LOGS_DIR, log_file),
+        maxBytes=max_bytes,
+        backupCount=backup_count
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    queue_handler = AsyncQueueHandler(queue.Queue(queue_size))
+    queue_handler.addFilter(RateLimitFilter(max_per_interval, interval, sample_every))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, stream_handler,
+                              respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+def benchmark(records=20000, threads=8):
+    """
+    Measure the time callers spend in logging calls under concurrent load.
+
+    Compares the old synchronous RotatingFileHandler setup with the queued
+    one, writing to a temporary directory. Console output is left out so
+    only the file I/O is compared.
+    """
+    payload = {'computer_id': 'bench-host', 'cpu_usage': 12.5, 'memory_usage': 48.2,
+               'processes': list(range(200))}
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for mode in ('sync', 'queued'):
+            bench_logger = logging.getLogger(f"logging_benchmark.{mode}")
+            bench_logger.propagate = False
+            bench_logger.setLevel(logging.INFO)
+            file_handler = RotatingFileHandler(os.path.join(tmp_dir, f"{mode}.log"),
+                                               maxBytes=1024*1024, backupCount=5)
+            file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            listener = None
+            if mode == 'sync':
+                bench_logger.addHandler(file_handler)
+            else:
+                # Unbounded and unfiltered so every record is really written
+                queue_handler = AsyncQueueHandler(queue.Queue())
+                bench_logger.addHandler(queue_handler)
+                listener = QueueListener(queue_handler.queue, file_handler)
+                listener.start()
+
+            per_thread = records // threads
+            timings = []
+
+            def worker():
+                for i in range(per_thread):
+                    start = time.perf_counter()
+                    if mode == 'sync':
+                        bench_logger.info(f"Received metrics data from IP 127.0.0.1: {payload}")
+                    else:
+                        bench_logger.info("Received metrics data from IP %s: %s",
+                                          '127.0.0.1', truncate(payload))
+                    timings.append(time.perf_counter() - start)
+
+            workers = [threading.Thread(target=worker) for _ in range(threads)]
+            wall_start = time.perf_counter()
+            for t in workers:
+                t.start()
+            for t in workers:
+                t.join()
+            wall = time.perf_counter() - wall_start
+
+            if listener:
+                listener.stop()
+            bench_logger.handlers.clear()
+            file_handler.close()
+
+            timings.sort()
+            results[mode] = {
+                'calls_per_sec': len(timings) / wall,
+                'mean_us': sum(timings) / len(timings) * 1e6,
+                'p99_us': timings[int(len(timings) * 0.99)] * 1e6
+            }
+
+    return results
+
+
+if __name__ == "__main__":
+    for mode, stats in benchmark().items():
+        sys.stdout.write(f"{mode:>7}: {stats['calls_per_sec']:.0f} calls/s, "
+                         f"mean {stats['mean_us']:.1f} us, p99 {stats['p99_us']:.1f} us\n")
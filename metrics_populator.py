@@ -2,36 +2,18 @@ import psutil
 import os
 import uuid
 import socket
+from urllib.parse import urljoin
 from datetime import datetime
 import logging
-from logging.handlers import RotatingFileHandler
 
 # Import from our utility module and config
 from collector_utils import CollectorBase
+from logging_utils import setup_logging
 from config import SYSTEM_METRICS_ENDPOINT, METRICS_STATUS_ENDPOINT
 
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'metrics.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=5        # Keep 5 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Generate a unique computer ID
@@ -48,7 +30,6 @@ def generate_computer_id():
 
 # Store the computer ID
 COMPUTER_ID = generate_computer_id()
-logger.info(f"Computer ID: {COMPUTER_ID}")
 
 def gather_metrics():
     """Gathers core system metrics."""
@@ -64,21 +45,31 @@ def gather_metrics():
     # Add timestamp for logging purposes
     metrics['timestamp'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    logger.info(f"Gathered metrics: CPU {metrics['cpu_usage']}%, Memory {metrics['memory_usage']}%")
+    logger.info("Gathered metrics: CPU %s%%, Memory %s%%", metrics['cpu_usage'], metrics['memory_usage'])
     return metrics
 
-def main():
-    """Main function to start the metrics collection service."""
-    # Create a collector instance
-    collector = CollectorBase(
+def create_collector():
+    """Create the system metrics collector."""
+    return CollectorBase(
         endpoint_url=SYSTEM_METRICS_ENDPOINT,
         status_url=METRICS_STATUS_ENDPOINT,
         collection_interval=5,  # 5 seconds between collections
-        collector_name="SystemMetrics"
+        collector_name="SystemMetrics",
+        collector_id=COMPUTER_ID,
+        group="system",
+        # Commands arrive over the control channel instead of polling the status endpoint
+        control_url=urljoin(SYSTEM_METRICS_ENDPOINT, '/api/control/poll')
     )
+
+def main():
+    """Main function to start the metrics collection service."""
+    # Configure logging through the shared background writer
+    setup_logging('metrics.log')
+    logger.info("Computer ID: %s", COMPUTER_ID)
+    collector = create_collector()
     
-    # Run the collection loop
-    collector.run_collection_loop(gather_metrics)
+    # Run the collection loop, spreading hosts over the 5 second period
+    collector.run_collection_loop(gather_metrics, jitter=5)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
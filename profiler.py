@@ -0,0 +1,174 @@
+import io
+import time
+import logging
+import random
+import pstats
+import cProfile
+import itertools
+from collections import deque
+from datetime import datetime
+
+from flask import g, request, has_request_context
+
+from logging_utils import Truncated
+
+logger = logging.getLogger(__name__)
+
+# Header or query parameter that turns on profiling for one request
+PROFILE_HEADER = 'X-Debug-Profile'
+PROFILE_QUERY_ARG = '_profile'
+
+# Number of functions kept in each captured profile
+PROFILE_TOP_FUNCTIONS = 40
+
+
+def _one_line(sql):
+    """Collapse the whitespace of a multi-line SQL string."""
+    return ' '.join(sql.split())
+
+
+def explain_query_plan(conn, sql, params):
+    """Return the EXPLAIN QUERY PLAN output of a statement as indented lines."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        node_id, parent_id, _, detail = tuple(row)
+        depth[node_id] = depth.get(parent_id, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return lines
+
+
+class RequestProfiler:
+    """
+    Opt-in request profiler and slow query log.
+
+    A request is profiled with cProfile when it carries the X-Debug-Profile
+    header or the _profile query argument, or when it is picked by random
+    sampling. Every named SQL statement slower than the threshold is logged
+    with its bound parameters and EXPLAIN QUERY PLAN output. Both are kept
+    in fixed-size ring buffers for the debug endpoints.
+
+    Sharded reads run on the store's pool threads, which cProfile does not
+    follow: the profile shows the request waiting for them, and their
+    statements are listed with the request's queries.
+
+    When no request is profiled the only per-request cost is the flag check,
+    and the only per-query cost is a comparison against the threshold.
+    """
+
+    def __init__(self, sample_rate=0.0, slow_query_ms=200, buffer_size=50):
+        self.sample_rate = sample_rate
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.profiles = deque(maxlen=buffer_size)
+        self.slow_queries = deque(maxlen=buffer_size)
+        self._ids = itertools.count(1)
+
+    def init_app(self, app, telemetry):
+        """Install the request hooks and listen to the telemetry SQL helpers."""
+        app.before_request(self._start_profile)
+        app.after_request(self._finish_profile)
+        telemetry.add_query_listener(self.on_query)
+
+    def _profile_reason(self):
+        if request.headers.get(PROFILE_HEADER) == '1':
+            return 'header'
+        if request.args.get(PROFILE_QUERY_ARG) == '1':
+            return 'query'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def _start_profile(self):
+        reason = self._profile_reason()
+        if reason is None:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active on this interpreter
+            return
+        g.profile = profile
+        g.profile_reason = reason
+        g.profile_start = time.perf_counter()
+        g.profile_queries = []
+
+    def _finish_profile(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        profile.disable()
+        duration = time.perf_counter() - g.pop('profile_start')
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+
+        profile_id = next(self._ids)
+        self.profiles.append({
+            'id': profile_id,
+            'timestamp': datetime.now().isoformat(),
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'reason': g.pop('profile_reason'),
+            'duration_ms': round(duration * 1000, 3),
+            'queries': g.pop('profile_queries'),
+            'profile': stream.getvalue()
+        })
+        response.headers['X-Debug-Profile-Id'] = str(profile_id)
+        return response
+
+    def on_query(self, cur, statement, sql, params, seconds):
+        """Telemetry query listener: record profiled and slow statements."""
+        profiled = has_request_context() and 'profile_queries' in g
+        slow = seconds >= self.slow_query_seconds
+        if not (profiled or slow):
+            return
+
+        if profiled:
+            g.profile_queries.append({
+                'statement': statement,
+                'duration_ms': round(seconds * 1000, 3)
+            })
+        if not slow:
+            return
+
+        logger.warning("Slow query %s took %.1f ms", statement, seconds * 1000)
+
+        # executemany passes a sequence of parameter sets; explain the first
+        explain_params = params
+        if params and isinstance(params, list) and isinstance(params[0], (list, tuple)):
+            explain_params = params[0]
+        try:
+            plan = explain_query_plan(cur.connection, sql, explain_params)
+        except Exception as e:
+            plan = [f"EXPLAIN QUERY PLAN failed: {e}"]
+
+        self.slow_queries.append({
+            'timestamp': datetime.now().isoformat(),
+            'statement': statement,
+            'duration_ms': round(seconds * 1000, 3),
+            'route': request.url_rule.rule if has_request_context() and request.url_rule else None,
+            'sql': _one_line(sql),
+            'params': str(Truncated(params, 500)),
+            'query_plan': plan
+        })
+
+    def list_profiles(self):
+        """Summaries of the captured profiles, newest first."""
+        return [{key: value for key, value in entry.items() if key != 'profile'}
+                for entry in reversed(self.profiles)]
+
+    def get_profile(self, profile_id):
+        """Return the full captured profile with the given id, or None."""
+        for entry in self.profiles:
+            if entry['id'] == profile_id:
+                return entry
+        return None
+
+    def list_slow_queries(self):
+        """Captured slow statements, newest first."""
+        return list(reversed(self.slow_queries))
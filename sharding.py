@@ -0,0 +1,436 @@
+import os
+import json
+import zlib
+import heapq
+import queue
+import sqlite3
+import logging
+import argparse
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from logging_utils import setup_logging
+from telemetry import telemetry
+from db_schema import COLUMNS, COUNT_KEYS, create_schema
+
+# Define the base directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
+
+# Default location of the shard files and the manifest recording their count
+DEFAULT_SHARD_DIR = os.path.join(BASE_DIR, 'shards')
+MANIFEST_NAME = 'shards.json'
+
+# Every shard hands out ids from its own range, so ids stay unique across
+# shards and keyset cursors keep working on merged results
+ID_SPACE_BITS = 48
+
+# Most queued submissions a shard writer commits in one transaction
+WRITE_BATCH_MAX = 500
+
+# Rows per transaction when resharding
+RESHARD_BATCH_SIZE = 10000
+
+
+def shard_for_key(key, shard_count):
+    """
+    Return the shard index of a computer_id or symbol.
+
+    Uses CRC32 rather than hash(), which is randomized per process, so every
+    process and every run agrees on where a key lives.
+    """
+    return zlib.crc32(str(key if key is not None else '').encode('utf-8')) % shard_count
+
+
+def shard_path(directory, index):
+    """Path of shard ``index`` inside a shard directory."""
+    return os.path.join(directory, f"shard-{index:03d}.db")
+
+
+def has_shard_files(directory):
+    """Return True if a directory holds any shard database files."""
+    return os.path.isdir(directory) and any(
+        name.startswith('shard-') and name.endswith('.db') for name in os.listdir(directory))
+
+
+def read_manifest(directory):
+    """Return the shard count recorded in a shard directory, or None if there is none."""
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)['shard_count']
+
+
+def configured_shard_count():
+    """Shard count the app is configured with through METRICS_SHARD_COUNT, 0 when unsharded."""
+    return int(os.environ.get('METRICS_SHARD_COUNT', 0))
+
+
+def metrics_database_paths(database_path=None, shard_dir=None):
+    """
+    Database files the app stores the metrics in, for the maintenance tools.
+
+    An explicit ``database_path`` is used as is. Otherwise these are the
+    shards in ``shard_dir`` (default: shards/) when METRICS_SHARD_COUNT is
+    above 0, as in app.py, and database.db (or METRICS_DATABASE_PATH) when
+    it is not.
+
+    Raises:
+        ValueError: The shard directory has no manifest or another shard count
+    """
+    if database_path:
+        return [database_path]
+    shard_dir = shard_dir or DEFAULT_SHARD_DIR
+    shard_count = configured_shard_count()
+    if shard_count <= 0:
+        if read_manifest(shard_dir) is not None:
+            logger.warning("%s holds shards but METRICS_SHARD_COUNT is 0 or unset, using the single database",
+                           shard_dir)
+        return [os.environ.get('METRICS_DATABASE_PATH', os.path.join(BASE_DIR, 'database.db'))]
+    existing = read_manifest(shard_dir)
+    if existing != shard_count:
+        raise ValueError(f"METRICS_SHARD_COUNT is {shard_count} but {shard_dir} has "
+                         f"{'no shard manifest' if existing is None else f'{existing} shards'}")
+    return [shard_path(shard_dir, index) for index in range(shard_count)]
+
+
+def write_manifest(directory, shard_count):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'shard_count': shard_count, 'hash': 'crc32'}, f)
+    os.replace(path + '.tmp', path)
+
+
+def init_shard(path, index):
+    """Create the schema of one shard and seed its id range."""
+    with sqlite3.connect(path) as conn:
+        # Readers on the fan-out pool must not block the shard writer
+        conn.execute("PRAGMA journal_mode = WAL")
+        create_schema(conn)
+        for table in COLUMNS:
+            conn.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            ''', (table, index << ID_SPACE_BITS, table))
+
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """
+    Merge per-shard results that are each already sorted by ``key``.
+
+    Args:
+        results: One list of rows per shard
+        key: Sort key function, matching the ORDER BY of the shard query
+        reverse: True if the shard query sorted descending
+        limit: Stop after this many rows
+
+    Returns:
+        The merged rows as a list
+    """
+    return list(itertools.islice(heapq.merge(*results, key=key, reverse=reverse), limit))
+
+
+class ShardWriter:
+    """
+    Single writer thread of one shard.
+
+    Inserts are queued and committed by this thread only, so writers of
+    different shards never contend for the same SQLite lock. Everything
+    queued while a commit is in progress goes into the next transaction.
+    """
+
+    def __init__(self, path, index):
+        self.path = path
+        self.index = index
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"shard-writer-{index}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit(self, statement, sql, rows):
+        """Queue an executemany of ``rows``; the returned future resolves to the row count once committed."""
+        future = Future()
+        self.queue.put((statement, sql, rows, future))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _write(self, conn, batch):
+        telemetry.begin_write(conn, f"shard_{self.index}")
+        cur = conn.cursor()
+        for statement, sql, rows, _ in batch:
+            telemetry.execute(cur, statement, sql, rows, many=True)
+        telemetry.commit(conn, f"shard_{self.index}")
+
+    def _run(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            stopping = False
+            while not stopping:
+                item = self.queue.get()
+                if item is None:
+                    break
+                batch = [item]
+                while len(batch) < WRITE_BATCH_MAX:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                try:
+                    self._write(conn, batch)
+                except Exception as e:
+                    conn.rollback()
+                    if len(batch) == 1:
+                        batch[0][3].set_exception(e)
+                        continue
+                    # Retry one by one so a bad submission only fails itself
+                    for entry in batch:
+                        try:
+                            self._write(conn, [entry])
+                        except Exception as e:
+                            conn.rollback()
+                            entry[3].set_exception(e)
+                        else:
+                            entry[3].set_result(len(entry[2]))
+                    continue
+
+                for _, _, rows, future in batch:
+                    future.set_result(len(rows))
+        finally:
+            conn.close()
+
+
+class ShardedStore:
+    """
+    Metrics storage spread over several SQLite files by computer_id/symbol.
+
+    All rows of one host or symbol live in the same shard, chosen by
+    shard_for_key. Writes go through one ShardWriter per shard; reads are
+    fanned out over a thread pool and return one result list per shard for
+    the caller to merge (see merge_sorted).
+
+    The shard count is recorded in the directory's manifest on creation.
+    Opening the directory with a different count is refused, since keys
+    would hash to the wrong shards; use the reshard tool to change it. So is
+    a directory with shard files but no manifest, which is what an
+    interrupted reshard leaves behind.
+    """
+
+    def __init__(self, directory=DEFAULT_SHARD_DIR, shard_count=None, max_workers=None):
+        existing = read_manifest(directory)
+        if existing is None:
+            if not shard_count:
+                raise ValueError(f"No shard manifest in {directory}, a shard count is needed to create one")
+            if has_shard_files(directory):
+                raise ValueError(f"{directory} holds shard files but no manifest, probably from an "
+                                 "interrupted reshard; delete it and reshard again")
+            os.makedirs(directory, exist_ok=True)
+        elif shard_count and shard_count != existing:
+            raise ValueError(f"{directory} holds {existing} shards, not {shard_count}; reshard it first")
+        self.directory = directory
+        self.shard_count = existing or shard_count
+        self.paths = [shard_path(directory, index) for index in range(self.shard_count)]
+
+        for index, path in enumerate(self.paths):
+            init_shard(path, index)
+        if existing is None:
+            write_manifest(directory, self.shard_count)
+
+        self.writers = [ShardWriter(path, index) for index, path in enumerate(self.paths)]
+        for writer in self.writers:
+            writer.start()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or min(32, self.shard_count),
+                                       thread_name_prefix='shard-read')
+        self._local = threading.local()
+        logger.info("Opened %s shards in %s", self.shard_count, directory)
+
+    def shard_for(self, key):
+        return shard_for_key(key, self.shard_count)
+
+    def insert(self, table, statement, rows):
+        """
+        Insert rows into their shards and wait until every shard has committed.
+
+        Shards commit independently: if one shard fails, rows already
+        committed to the others stay.
+
+        Args:
+            table: laptop_metrics or stock_metrics
+            statement: Statement name for telemetry
+            rows: Tuples in COLUMNS[table] order
+
+        Returns:
+            Number of rows inserted
+        """
+        key_index = COLUMNS[table].index(COUNT_KEYS[table])
+        per_shard = {}
+        for row in rows:
+            per_shard.setdefault(self.shard_for(row[key_index]), []).append(row)
+
+        columns = COLUMNS[table]
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        futures = [self.writers[index].submit(statement, sql, shard_rows)
+                   for index, shard_rows in per_shard.items()]
+        return sum(future.result() for future in futures)
+
+    def _connection(self, index):
+        # Read connections are cached per pool thread and shard
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if index not in connections:
+            connections[index] = sqlite3.connect(self.paths[index])
+        return connections[index]
+
+    def _fetch_shard(self, index, statement, sql, params, row_factory):
+        cur = self._connection(index).cursor()
+        cur.row_factory = row_factory
+        try:
+            return telemetry.fetch_all(cur, statement, sql, params)
+        finally:
+            cur.close()
+
+    def fetch_all(self, statement, sql, params=(), row_factory=None, key=None):
+        """
+        Run a read query on every shard in parallel.
+
+        Args:
+            statement: Statement name for telemetry
+            sql: Query, run unchanged on each shard
+            params: Query parameters
+            row_factory: Row factory for the result rows, e.g. sqlite3.Row
+            key: Only query the shard holding this computer_id/symbol
+
+        Returns:
+            One list of rows per queried shard
+        """
+        indexes = [self.shard_for(key)] if key is not None else range(self.shard_count)
+        # Each shard query runs in a copy of the caller's context, so query
+        # listeners such as the profiler see the request it was made for
+        futures = [self.pool.submit(contextvars.copy_context().run, self._fetch_shard, index, statement, sql,
+                                    params, row_factory)
+                   for index in indexes]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Stop the writers after they have committed everything queued."""
+        for writer in self.writers:
+            writer.stop()
+        self.pool.shutdown()
+
+
+def source_paths(source):
+    """Database files of a reshard source: a single database file or a shard directory."""
+    if os.path.isdir(source):
+        shard_count = read_manifest(source)
+        if shard_count is None:
+            raise ValueError(f"{source} has no shard manifest")
+        return [shard_path(source, index) for index in range(shard_count)]
+    if not os.path.exists(source):
+        raise ValueError(f"{source} does not exist")
+    return [source]
+
+
+def reshard(source, target, shard_count, batch_size=RESHARD_BATCH_SIZE):
+    """
+    Copy every metrics row from ``source`` into a new set of ``shard_count`` shards.
+
+    The source is only read, so the app can keep running against it. Rows
+    are copied in id order, which keeps each series in its original order,
+    and get new ids from their target shard's range. The target manifest is
+    written last: an interrupted run leaves a directory the app will not
+    open, and can simply be deleted and started again.
+
+    Args:
+        source: database.db or an existing shard directory
+        target: New, empty shard directory
+        shard_count: Number of shards to create
+        batch_size: Rows read per source query and transaction
+
+    Returns:
+        Dict of table name to number of rows copied
+    """
+    if read_manifest(target) is not None or (os.path.isdir(target) and os.listdir(target)):
+        raise ValueError(f"{target} is not empty")
+    sources = source_paths(source)
+    os.makedirs(target, exist_ok=True)
+
+    paths = [shard_path(target, index) for index in range(shard_count)]
+    for index, path in enumerate(paths):
+        init_shard(path, index)
+    targets = [sqlite3.connect(path) for path in paths]
+
+    copied = {}
+    try:
+        for table, columns in COLUMNS.items():
+            key_index = columns.index(COUNT_KEYS[table])
+            insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            copied[table] = 0
+
+            for path in sources:
+                with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+                    last_id = -1
+                    while True:
+                        rows = conn.execute(f'''
+                            SELECT id, {', '.join(columns)} FROM {table}
+                            WHERE id > ? ORDER BY id LIMIT ?
+                        ''', (last_id, batch_size)).fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1][0]
+
+                        per_shard = {}
+                        for row in rows:
+                            per_shard.setdefault(shard_for_key(row[1 + key_index], shard_count), []).append(row[1:])
+                        for index, shard_rows in per_shard.items():
+                            targets[index].executemany(insert_sql, shard_rows)
+                            targets[index].commit()
+
+                        copied[table] += len(rows)
+                logger.info("Copied %s rows of %s so far (from %s)", copied[table], table, path)
+    finally:
+        for conn in targets:
+            conn.close()
+
+    write_manifest(target, shard_count)
+    logger.info("Resharded %s into %s shards in %s: %s", source, shard_count, target, copied)
+    return copied
+
+
+def main():
+    setup_logging('sharding.log', backup_count=3, max_per_interval=0)
+    parser = argparse.ArgumentParser(
+        description="Reshard the metrics database into a new set of shard files. "
+                    "Stop ingest (or accept losing rows written meanwhile), run this, "
+                    "then point SHARD_DIR/SHARD_COUNT in app.py (or METRICS_SHARD_COUNT) at the "
+                    "new directory.")
+    parser.add_argument('source', help="database.db or an existing shard directory")
+    parser.add_argument('target', help="new, empty shard directory")
+    parser.add_argument('--shards', type=int, required=True, help="number of shards to create")
+    parser.add_argument('--batch-size', type=int, default=RESHARD_BATCH_SIZE, help="rows per transaction")
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    try:
+        reshard(args.source, args.target, args.shards, args.batch_size)
+    except ValueError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
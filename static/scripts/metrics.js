@@ -875,12 +875,22 @@ console.log('Metrics update interval set:', intervalId);
 // Function to initialize the system metrics DataTable
 function initSystemMetricsTable() {
     systemMetricsTable = $('#system-metrics-table').DataTable({
+        serverSide: true,
+        processing: true,
+        ajax: fetchSystemMetricsPage,
         columns: [
-            { data: 'timestamp', title: 'Timestamp' },
+            { 
+                data: 'timestamp', 
+                title: 'Timestamp',
+                render: function(data) {
+                    return data ? new Date(data).toLocaleString() : '';
+                }
+            },
             { data: 'computer_id', title: 'Computer ID' },
             { 
                 data: 'cpu_usage', 
                 title: 'CPU Usage (%)',
+                orderable: false, // Not indexed, so not sortable server-side
                 render: function(data) {
                     return data.toFixed(1) + '%';
                 }
@@ -888,6 +898,7 @@ function initSystemMetricsTable() {
             { 
                 data: 'memory_usage', 
                 title: 'Memory Usage (%)',
+                orderable: false,
                 render: function(data) {
                     return data.toFixed(1) + '%';
                 }
@@ -895,26 +906,46 @@ function initSystemMetricsTable() {
         ],
         order: [[0, 'desc']], // Sort by timestamp descending
         pageLength: 10,
-        lengthMenu: [[10, 25, 50, 100, -1], [10, 25, 50, 100, "All"]],
+        lengthMenu: [10, 25, 50, 100, 500],
+        searchDelay: 400,
         responsive: true,
         language: {
-            emptyTable: "No system metrics data available"
+            emptyTable: "No system metrics data available",
+            search: "Computer ID starts with:"
         }
     });
-    
-    // Initial data fetch
-    fetchSystemMetricsForTable();
 }
 
-// Function to fetch system metrics data for the DataTable
-function fetchSystemMetricsForTable() {
-    console.log('Fetching system metrics for table...');
+// Keyset cursors for the system metrics table, keyed by page start offset.
+// They are only valid for the ordering/search/page size they were made with,
+// and stay valid as new rows arrive.
+let systemTableCursors = {};
+let systemTableCursorKey = null;
+
+// DataTables ajax callback: request one page from the server, sending the
+// keyset cursor of the previous page when we have one
+function fetchSystemMetricsPage(request, callback) {
+    const order = request.order.length ? request.order[0] : { column: 0, dir: 'desc' };
+    const cursorKey = `${order.column}:${order.dir}:${request.search.value}:${request.length}`;
+    if (cursorKey !== systemTableCursorKey) {
+        systemTableCursors = {};
+        systemTableCursorKey = cursorKey;
+    }
     
-    // Show loading indicator
-    $('#refresh-system-table').html('<i class="fas fa-spinner fa-spin"></i> Loading...');
-    $('#refresh-system-table').prop('disabled', true);
+    const params = new URLSearchParams({
+        'draw': request.draw,
+        'start': request.start,
+        'length': request.length,
+        'search[value]': request.search.value,
+        'order[0][column]': order.column,
+        'order[0][dir]': order.dir
+    });
+    const cursor = systemTableCursors[request.start];
+    if (cursor) {
+        params.set('cursor', cursor);
+    }
     
-    fetch(`${API_BASE_URL}/api/system_metrics/table`)
+    fetch(`${API_BASE_URL}/api/system_metrics/table?${params.toString()}`)
         .then(response => {
             if (!response.ok) {
                 throw new Error(`HTTP error! Status: ${response.status}`);
@@ -922,34 +953,39 @@ function fetchSystemMetricsForTable() {
             return response.json();
         })
         .then(data => {
-            console.log(`Retrieved ${data.length} system metrics records for table`);
-            
-            // Format timestamps for better readability
-            data.forEach(item => {
-                if (item.timestamp) {
-                    const date = new Date(item.timestamp);
-                    item.timestamp = date.toLocaleString();
-                }
-            });
-            
-            // Clear existing data and add new data
-            systemMetricsTable.clear();
-            systemMetricsTable.rows.add(data);
-            systemMetricsTable.draw();
-            
-            // Reset refresh button
-            $('#refresh-system-table').html('<i class="fas fa-sync-alt"></i> Refresh Data');
-            $('#refresh-system-table').prop('disabled', false);
+            console.log(`Retrieved ${data.data.length} of ${data.recordsFiltered} system metrics records for table`);
+            if (data.next_cursor) {
+                systemTableCursors[request.start + request.length] = data.next_cursor;
+            }
+            callback(data);
+            resetSystemTableRefreshButton();
         })
         .catch(error => {
             console.error('Error fetching system metrics for table:', error);
-            
-            // Reset refresh button
-            $('#refresh-system-table').html('<i class="fas fa-sync-alt"></i> Refresh Data');
-            $('#refresh-system-table').prop('disabled', false);
+            callback({ draw: request.draw, recordsTotal: 0, recordsFiltered: 0, data: [] });
+            resetSystemTableRefreshButton();
         });
 }
 
+// Function to refresh the system metrics DataTable
+function fetchSystemMetricsForTable() {
+    console.log('Fetching system metrics for table...');
+    
+    // Show loading indicator
+    $('#refresh-system-table').html('<i class="fas fa-spinner fa-spin"></i> Loading...');
+    $('#refresh-system-table').prop('disabled', true);
+    
+    // Stay on the current page. The cursors are kept: new rows do not move the
+    // rows a cursor points after, so a deep page is reloaded through its cursor
+    // rather than by offset.
+    systemMetricsTable.ajax.reload(null, false);
+}
+
+function resetSystemTableRefreshButton() {
+    $('#refresh-system-table').html('<i class="fas fa-sync-alt"></i> Refresh Data');
+    $('#refresh-system-table').prop('disabled', false);
+}
+
 // Function to toggle metrics collection
 function toggleMetricsCollection() {
     const button = document.getElementById('toggle-metrics');
@@ -1,12 +1,15 @@
 import requests
 import logging
-from logging.handlers import RotatingFileHandler
-import json
 import os
+import time
+import socket
+from urllib.parse import urljoin
 from datetime import datetime
 
 # Import from our utility module and config
+import config
 from collector_utils import CollectorBase
+from logging_utils import setup_logging, truncate
 from config import (
     STOCK_SYMBOLS, 
     STOCK_API_INTERVAL, 
@@ -18,32 +21,17 @@ from config import (
 # Define the base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Create a logs directory if it doesn't exist
-logs_dir = os.path.join(BASE_DIR, 'logs')
-if not os.path.exists(logs_dir):
-    os.makedirs(logs_dir)
-
-# Configure logging with rotation
-log_path = os.path.join(logs_dir, 'stock_metrics.log')
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            log_path,
-            maxBytes=1024*1024,  # 1 MB
-            backupCount=5        # Keep 5 backup files
-        ),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Finnhub API location; config may point it elsewhere, e.g. at the stub
+# started by load_simulator.py
+FINNHUB_BASE_URL = getattr(config, 'FINNHUB_BASE_URL', 'https://finnhub.io')
+
 def fetch_stock_data(symbol):
     """Fetches real-time stock data from Finnhub."""
-    url = f"https://finnhub.io/api/v1/quote?symbol={symbol}&token={FINNHUB_API_KEY}"
+    url = f"{FINNHUB_BASE_URL}/api/v1/quote?symbol={symbol}&token={FINNHUB_API_KEY}"
     
-    logger.info(f"Fetching data for symbol: {symbol}")
+    logger.info("Fetching data for symbol: %s", symbol)
     
     try:
         response = requests.get(url)
@@ -64,13 +52,13 @@ def fetch_stock_data(symbol):
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             
-            logger.info(f"Fetched data for {symbol}: ${stock_data['price']} ({stock_data['change_percent']}%)")
+            logger.info("Fetched data for %s: $%s (%s%%)", symbol, stock_data['price'], stock_data['change_percent'])
             return stock_data
         else:
-            logger.error(f"Error fetching data for {symbol}: {json.dumps(data)}")
+            logger.error("Error fetching data for %s: %s", symbol, truncate(data))
             return None
     except Exception as e:
-        logger.error(f"Exception fetching data for {symbol}: {e}")
+        logger.error("Exception fetching data for %s: %s", symbol, e)
         return None
 
 def gather_stock_metrics():
@@ -84,20 +72,28 @@ def gather_stock_metrics():
             all_stock_data.append(stock_data)
         
         # Small delay between API calls to avoid rate limits
-        import time
         time.sleep(1)
     
     return all_stock_data if all_stock_data else None
 
-def main():
-    """Main function to start the stock metrics collection service."""
-    # Create a collector instance
-    collector = CollectorBase(
+def create_collector():
+    """Create the stock metrics collector."""
+    return CollectorBase(
         endpoint_url=STOCK_METRICS_ENDPOINT,
         status_url=METRICS_STATUS_ENDPOINT,  # Allow stopping stock metrics collection too
         collection_interval=STOCK_API_INTERVAL,
-        collector_name="StockMetrics"
+        collector_name="StockMetrics",
+        collector_id=f"stock-{socket.gethostname()}",
+        group="stock",
+        # Commands arrive over the control channel instead of polling the status endpoint
+        control_url=urljoin(STOCK_METRICS_ENDPOINT, '/api/control/poll')
     )
+
+def main():
+    """Main function to start the stock metrics collection service."""
+    # Configure logging through the shared background writer
+    setup_logging('stock_metrics.log')
+    collector = create_collector()
     
     # Run the collection loop
     collector.run_collection_loop(gather_stock_metrics)
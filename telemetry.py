@@ -0,0 +1,360 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Quantiles reported for every histogram
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# Window used for the recent rate of counters such as ingested rows
+RATE_WINDOW_SECONDS = 60
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the spirit of HdrHistogram.
+
+    Values are recorded in microseconds. Values below 2**SUB_BUCKET_BITS get
+    an exact bucket; above that each power of two is split into
+    2**(SUB_BUCKET_BITS - 1) linear sub-buckets, so quantiles are accurate to
+    about 3% across the whole range while recording stays O(1) and memory
+    only grows with the number of distinct buckets hit.
+    """
+
+    SUB_BUCKET_BITS = 6
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _index(cls, micros):
+        bits = cls.SUB_BUCKET_BITS
+        if micros < (1 << bits):
+            return micros
+        shift = micros.bit_length() - bits
+        mantissa = micros >> shift
+        half = 1 << (bits - 1)
+        return (1 << bits) + (shift - 1) * half + (mantissa - half)
+
+    @classmethod
+    def _bucket_range(cls, index):
+        """Return the (low, high) microsecond values covered by a bucket."""
+        bits = cls.SUB_BUCKET_BITS
+        if index < (1 << bits):
+            return index, index
+        half = 1 << (bits - 1)
+        offset = index - (1 << bits)
+        shift = offset // half + 1
+        mantissa = offset % half + half
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        """Record one observation given in seconds."""
+        micros = max(int(seconds * 1e6), 0)
+        index = self._index(micros)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.total += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return {quantile: seconds} estimated from the bucket midpoints."""
+        with self._lock:
+            buckets = sorted(self.counts.items())
+            count = self.count
+        result = {}
+        if not count:
+            return {q: 0.0 for q in quantiles}
+        targets = sorted(quantiles)
+        seen = 0
+        position = 0
+        for index, bucket_count in buckets:
+            seen += bucket_count
+            while position < len(targets) and seen >= targets[position] * count:
+                low, high = self._bucket_range(index)
+                result[targets[position]] = (low + high) / 2 / 1e6
+                position += 1
+            if position == len(targets):
+                break
+        return result
+
+    def summary(self):
+        """Return count, sum, min, max, mean and quantiles as a dict."""
+        quantiles = self.quantiles()
+        with self._lock:
+            data = {
+                'count': self.count,
+                'sum': self.total,
+                'min': self.min or 0.0,
+                'max': self.max or 0.0,
+                'mean': self.total / self.count if self.count else 0.0
+            }
+        for q, value in quantiles.items():
+            data[f"p{q * 100:g}".replace('.', '')] = value
+        return data
+
+
+class RateMeter:
+    """Counts events in one-second slots to report a recent per-second rate."""
+
+    def __init__(self, window=RATE_WINDOW_SECONDS):
+        self.window = window
+        self.slots = [0] * window
+        self.slot_times = [0] * window
+        self._lock = threading.Lock()
+
+    def mark(self, amount=1):
+        now = int(time.monotonic())
+        slot = now % self.window
+        with self._lock:
+            if self.slot_times[slot] != now:
+                self.slot_times[slot] = now
+                self.slots[slot] = 0
+            self.slots[slot] += amount
+
+    def rate(self):
+        """Average events per second over the window."""
+        now = int(time.monotonic())
+        with self._lock:
+            total = sum(count for count, stamp in zip(self.slots, self.slot_times)
+                        if now - stamp < self.window)
+        return total / self.window
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Telemetry:
+    """
+    In-process registry of latency histograms, counters and rates.
+
+    Metrics are identified by name plus a small set of labels (route,
+    statement, table). Everything is kept in memory for the lifetime of the
+    process and can be rendered in Prometheus text format or as a JSON
+    friendly snapshot.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.rates = {}
+        self.help = {}
+        self.query_listeners = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        """Set the HELP text for a metric."""
+        self.help[name] = text
+
+    def observe(self, name, seconds, **labels):
+        """Record a latency observation in seconds."""
+        key = (name, _label_key(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram())
+        histogram.record(seconds)
+
+    def increment(self, name, amount=1, **labels):
+        """Add to a monotonically increasing counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def mark(self, name, amount=1, **labels):
+        """Increment a counter and feed its recent per-second rate."""
+        self.increment(name, amount, **labels)
+        key = (name, _label_key(labels))
+        meter = self.rates.get(key)
+        if meter is None:
+            with self._lock:
+                meter = self.rates.setdefault(key, RateMeter())
+        meter.mark(amount)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Context manager recording the duration of its block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_query_listener(self, listener):
+        """
+        Register a callback run after every named SQL statement.
+
+        The listener is called as listener(cur, statement, sql, params, seconds)
+        on the request thread, so it should return quickly in the common case.
+        """
+        self.query_listeners.append(listener)
+
+    def _record_query(self, cur, statement, sql, params, seconds):
+        self.observe('sql_query_duration_seconds', seconds, statement=statement)
+        for listener in self.query_listeners:
+            listener(cur, statement, sql, params, seconds)
+
+    def fetch_all(self, cur, statement, sql, params=()):
+        """Execute a named query and fetch all rows, recording time and row count."""
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        self._record_query(cur, statement, sql, params, time.perf_counter() - start)
+        self.increment('sql_rows_returned_total', len(rows), statement=statement)
+        return rows
+
+    def execute(self, cur, statement, sql, params=(), many=False):
+        """Execute a named write statement, recording its time and affected rows."""
+        start = time.perf_counter()
+        if many:
+            cur.executemany(sql, params)
+        else:
+            cur.execute(sql, params)
+        self._record_query(cur, statement, sql, params, time.perf_counter() - start)
+        self.increment('sql_rows_written_total', max(cur.rowcount, 0), statement=statement)
+        return cur
+
+    def begin_write(self, conn, statement):
+        """
+        Start a write transaction, recording how long the write lock took.
+
+        BEGIN IMMEDIATE takes SQLite's write lock up front, so time spent
+        blocked behind other writers is recorded here instead of inside the
+        statement and commit timings.
+        """
+        with self.timer('db_lock_wait_seconds', statement=statement):
+            conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self, conn, statement):
+        """Commit a connection, recording the commit latency."""
+        with self.timer('db_commit_duration_seconds', statement=statement):
+            conn.commit()
+
+    def init_app(self, app):
+        """Record latency, status and response size of every Flask request."""
+
+        @app.before_request
+        def _start_request_timer():
+            g.telemetry_start = time.perf_counter()
+
+        @app.after_request
+        def _record_request(response):
+            start = g.pop('telemetry_start', None)
+            if start is None:
+                return response
+            # Use the route pattern rather than the path to keep labels bounded
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.observe('http_request_duration_seconds', time.perf_counter() - start,
+                         route=route, method=request.method)
+            self.increment('http_requests_total', route=route, method=request.method,
+                           status=response.status_code)
+            size = response.content_length
+            if size is None and not response.is_streamed:
+                size = response.calculate_content_length()
+            if size:
+                self.increment('http_response_bytes_total', size, route=route)
+            return response
+
+    def snapshot(self):
+        """Return every metric as plain dicts, suitable for JSON."""
+        with self._lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+            rates = list(self.rates.items())
+
+        data = {
+            'uptime_seconds': time.time() - self.started,
+            'histograms': {},
+            'counters': {},
+            'rates': {}
+        }
+        for (name, labels), histogram in sorted(histograms, key=lambda item: item[0]):
+            entry = {'labels': dict(labels)}
+            entry.update(histogram.summary())
+            data['histograms'].setdefault(name, []).append(entry)
+        for (name, labels), value in sorted(counters, key=lambda item: item[0]):
+            data['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), meter in sorted(rates, key=lambda item: item[0]):
+            data['rates'].setdefault(f"{name.removesuffix('_total')}_per_second", []).append(
+                {'labels': dict(labels), 'value': meter.rate()})
+        return data
+
+    def render_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            counters = sorted(self.counters.items(), key=lambda item: item[0])
+            rates = sorted(self.rates.items(), key=lambda item: item[0])
+
+        lines = [
+            '# HELP process_uptime_seconds Seconds since the telemetry registry was created.',
+            '# TYPE process_uptime_seconds gauge',
+            f"process_uptime_seconds {time.time() - self.started:.3f}"
+        ]
+        declared = set()
+
+        def declare(name, metric_type):
+            if name in declared:
+                return
+            declared.add(name)
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), histogram in histograms:
+            declare(name, 'summary')
+            for q, value in histogram.quantiles().items():
+                lines.append(f"{name}{_format_labels(labels, [('quantile', q)])} {value:.6f}")
+            summary = histogram.summary()
+            lines.append(f"{name}_sum{_format_labels(labels)} {summary['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {summary['count']}")
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), meter in rates:
+            gauge = f"{name.removesuffix('_total')}_per_second"
+            declare(gauge, 'gauge')
+            lines.append(f"{gauge}{_format_labels(labels)} {meter.rate():.3f}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Shared registry used by the app
+telemetry = Telemetry()
+telemetry.describe('http_request_duration_seconds', 'Request latency per route.')
+telemetry.describe('http_requests_total', 'Requests per route, method and status.')
+telemetry.describe('http_response_bytes_total', 'Response body bytes per route.')
+telemetry.describe('sql_query_duration_seconds', 'Latency of named SQL statements.')
+telemetry.describe('sql_rows_returned_total', 'Rows fetched per named SQL statement.')
+telemetry.describe('sql_rows_written_total', 'Rows written per named SQL statement.')
+telemetry.describe('db_commit_duration_seconds', 'Commit latency per write path.')
+telemetry.describe('db_lock_wait_seconds', 'Time spent waiting for the database write lock per write path.')
+telemetry.describe('ingest_rows_total', 'Rows ingested per table.')
+telemetry.describe('collector_schedule_lag_seconds', 'Scheduling lag reported by collectors per group.')
+telemetry.describe('collector_schedule_skipped_total', 'Collection slots skipped by collectors per group.')
+telemetry.describe('ingest_rows_per_second', 'Rows ingested per second over the last minute.')
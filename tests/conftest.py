@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging_utils
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """app.py, imported against a scratch database and log directory."""
+    base = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(logging_utils, 'LOGS_DIR', str(base / 'logs'))
+        mp.setenv('METRICS_DATABASE_PATH', str(base / 'database.db'))
+        mp.setenv('METRICS_SHARD_COUNT', '0')
+        import app
+    return app
@@ -0,0 +1,70 @@
+import csv
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import db_bulk
+from db_stats import open_readonly, series_stats, verify_counts
+
+HOSTS = ['host-a', 'host-b', 'host-c']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'computer_id', 'cpu_usage', 'memory_usage', 'timestamp'])
+        writer.writerows(rows)
+
+
+def csv_rows(count):
+    return [(i + 1, HOSTS[i % len(HOSTS)], float(i % 100), 50.0, f"2026-10-01 00:{i // 60:02d}:{i % 60:02d}")
+            for i in range(count)]
+
+
+def table_state(path):
+    with open_readonly(path) as conn:
+        count = conn.execute("SELECT COUNT(*) FROM laptop_metrics").fetchone()[0]
+        records = conn.execute("SELECT records FROM bulk_import_checkpoints").fetchone()[0]
+        assert all(result['ok'] for result in verify_counts(conn, series_stats(conn)).values())
+        return count, records
+
+
+def test_failed_batch_is_not_committed(tmp_path):
+    database, source = str(tmp_path / 'database.db'), str(tmp_path / 'rows.csv')
+    rows = csv_rows(100)
+    # A duplicate id in the second batch fails it halfway through executemany
+    write_csv(source, rows[:70] + [rows[0]] + rows[71:])
+    with pytest.raises(sqlite3.IntegrityError):
+        db_bulk.import_file('laptop_metrics', source, database=database, batch_size=50, keep_ids=True)
+    assert table_state(database) == (50, 50)
+
+    write_csv(source, rows)
+    assert db_bulk.import_file('laptop_metrics', source, database=database, batch_size=50, keep_ids=True) == 50
+    assert table_state(database) == (len(rows), len(rows))
+
+
+def test_interrupted_import_resumes(tmp_path, monkeypatch):
+    database, source = str(tmp_path / 'database.db'), str(tmp_path / 'rows.csv')
+    rows = csv_rows(120)
+    write_csv(source, rows)
+
+    class InterruptedClock(datetime):
+        calls = 0
+
+        @classmethod
+        def now(cls, tz=None):
+            # Ctrl-C between the second batch's rows and its checkpoint
+            cls.calls += 1
+            if cls.calls == 2:
+                raise KeyboardInterrupt
+            return datetime.now(tz)
+
+    monkeypatch.setattr(db_bulk, 'datetime', InterruptedClock)
+    with pytest.raises(KeyboardInterrupt):
+        db_bulk.import_file('laptop_metrics', source, database=database, batch_size=50)
+    assert table_state(database) == (50, 50)
+
+    monkeypatch.undo()
+    assert db_bulk.import_file('laptop_metrics', source, database=database, batch_size=50) == 70
+    assert table_state(database) == (len(rows), len(rows))
@@ -0,0 +1,33 @@
+import pytest
+
+
+def laptop_count(app_module):
+    with app_module.connect_db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM laptop_metrics").fetchone()[0]
+
+
+@pytest.mark.parametrize('lag', ['nan', 'inf', '-inf', 'soon'])
+def test_bad_schedule_lag_keeps_the_stored_row(app_module, lag):
+    client = app_module.app.test_client()
+    before = laptop_count(app_module)
+    response = client.post('/metrics', json={'computer_id': 'host-a', 'cpu_usage': 1.0, 'memory_usage': 2.0},
+                           headers={'X-Collector-Id': 'host-a', 'X-Schedule-Lag-Ms': lag})
+    assert response.status_code == 200
+    assert laptop_count(app_module) == before + 1
+
+
+def test_stop_state_reaches_new_collectors(app_module):
+    client = app_module.app.test_client()
+    assert client.post('/api/metrics/stop').get_json()['command'] == 'STOP'
+    try:
+        poll = client.get('/api/control/poll', query_string={'collector_id': 'late-poller'}).get_json()
+        assert poll['stop'] is True
+        response = client.post('/metrics', json={'computer_id': 'host-b', 'cpu_usage': 1.0, 'memory_usage': 2.0},
+                               headers={'X-Collector-Id': 'late-sender'})
+        assert response.get_json()['control']['stop'] is True
+    finally:
+        assert client.post('/api/metrics/stop').get_json()['command'] == 'RUN'
+    response = client.post('/metrics', json={'computer_id': 'host-b', 'cpu_usage': 1.0, 'memory_usage': 2.0},
+                           headers={'X-Collector-Id': 'late-sender', 'X-Control-Epoch': poll['epoch'],
+                                    'X-Control-Seq': str(poll['seq'])})
+    assert 'control' not in response.get_json()
@@ -0,0 +1,227 @@
+import sqlite3
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import sharding
+from db_schema import COLUMNS, COUNT_KEYS, create_schema
+from db_stats import open_readonly, series_stats, verify_counts
+from sharding import ID_SPACE_BITS, ShardedStore, merge_sorted, read_manifest, reshard, shard_for_key
+
+HOSTS = [f"host-{i:02d}" for i in range(12)]
+SYMBOLS = ['AAPL', 'MSFT', 'GOOGL', 'NVDA']
+
+
+def laptop_rows(count):
+    # Unique timestamps, so every ordering is the same whatever ids the rows get
+    return [(HOSTS[i % len(HOSTS)], float(i % 100), float(i % 37),
+             f"2026-10-01 {i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}") for i in range(count)]
+
+
+def stock_rows(count):
+    return [(SYMBOLS[i % len(SYMBOLS)], 100.0 + i, 0.5, f"2026-10-01 00:{i // 60 % 60:02d}:{i % 60:02d}")
+            for i in range(count)]
+
+
+def make_database(path, laptop, stock):
+    with sqlite3.connect(path) as conn:
+        create_schema(conn)
+        for table, rows in (('laptop_metrics', laptop), ('stock_metrics', stock)):
+            columns = COLUMNS[table]
+            conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                             rows)
+
+
+def read_rows(path, table):
+    with open_readonly(path) as conn:
+        return conn.execute(f"SELECT id, {', '.join(COLUMNS[table])} FROM {table}").fetchall()
+
+
+def check_shards(directory, shard_count, laptop, stock):
+    """Every row is in its key's shard with an id from that shard's range, and the counters match."""
+    assert read_manifest(directory) == shard_count
+    for table, expected in (('laptop_metrics', laptop), ('stock_metrics', stock)):
+        key_index = 1 + COLUMNS[table].index(COUNT_KEYS[table])
+        copied = []
+        for index in range(shard_count):
+            path = sharding.shard_path(directory, index)
+            for row in read_rows(path, table):
+                assert shard_for_key(row[key_index], shard_count) == index
+                assert row[0] >> ID_SPACE_BITS == index
+                copied.append(row)
+            with open_readonly(path) as conn:
+                assert all(result['ok'] for result in verify_counts(conn, series_stats(conn)).values())
+        assert len({row[0] for row in copied}) == len(copied)
+        assert sorted(row[1:] for row in copied) == sorted(expected)
+
+
+def test_merge_sorted():
+    results = [[1, 4, 9], [2, 3, 10], [], [5]]
+    assert merge_sorted(results, key=lambda value: value) == [1, 2, 3, 4, 5, 9, 10]
+    assert merge_sorted([list(reversed(rows)) for rows in results], key=lambda value: value,
+                        reverse=True, limit=3) == [10, 9, 5]
+
+
+def test_sort_key_orders_nulls_first(app_module):
+    rows = [{'timestamp': 'b', 'id': 2}, {'timestamp': None, 'id': 3}, {'timestamp': 'a', 'id': 1}]
+    assert [row['id'] for row in sorted(rows, key=app_module.sort_key('timestamp', 'id'))] == [3, 1, 2]
+
+
+@pytest.fixture
+def sharded_app(app_module, tmp_path, monkeypatch):
+    store = ShardedStore(str(tmp_path / 'shards'), 3)
+    monkeypatch.setattr(app_module, 'store', store)
+    # Small enough that the tests cross it
+    monkeypatch.setattr(app_module, 'SYSTEM_TABLE_MAX_SHARDED_OFFSET', 40)
+    yield app_module
+    store.close()
+
+
+def table_page(app_module, **args):
+    params = {'draw': '1', 'length': '25', 'order[0][column]': '0', 'order[0][dir]': 'desc'}
+    params.update({name: str(value) for name, value in args.items()})
+    return app_module.system_metrics_table_page(MultiDict(params))
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_sharded_table_paging(sharded_app, descending):
+    rows = laptop_rows(230)
+    sharded_app.insert_rows('laptop_metrics', 'insert_laptop_metrics', rows)
+    expected = [row[3] for row in sorted(rows, key=lambda row: row[3], reverse=descending)]
+    direction = 'desc' if descending else 'asc'
+
+    # Forward through every page with keyset cursors
+    seen = []
+    page = table_page(sharded_app, **{'order[0][dir]': direction})
+    while True:
+        assert page['recordsTotal'] == page['recordsFiltered'] == len(rows)
+        seen.extend(row['timestamp'] for row in page['data'])
+        if not page['next_cursor']:
+            break
+        page = table_page(sharded_app, cursor=page['next_cursor'], **{'order[0][dir]': direction})
+    assert seen == expected
+
+    # Offset pages near either end, including the partial last page read backwards
+    for start in (0, 25, 200, 225):
+        page = table_page(sharded_app, start=start, **{'order[0][dir]': direction})
+        assert [row['timestamp'] for row in page['data']] == expected[start:start + 25]
+
+    # Offsets deep in the middle are refused instead of loading every shard
+    page = table_page(sharded_app, start=100, **{'order[0][dir]': direction})
+    assert page['data'] == [] and 'error' in page
+
+
+def test_sharded_table_refresh_keeps_deep_page(sharded_app):
+    rows = laptop_rows(230)
+    sharded_app.insert_rows('laptop_metrics', 'insert_laptop_metrics', rows[:200])
+    cursors = {}
+    page = table_page(sharded_app)
+    for start in range(25, 125, 25):
+        cursors[start] = page['next_cursor']
+        page = table_page(sharded_app, start=start, cursor=cursors[start])
+    assert 'error' not in page
+
+    # New rows arrive before the table refreshes its current, deep page
+    sharded_app.insert_rows('laptop_metrics', 'insert_laptop_metrics', rows[200:])
+    refreshed = table_page(sharded_app, start=100, cursor=cursors[100])
+    assert 'error' not in refreshed
+    assert refreshed['data'] == page['data'] and refreshed['recordsFiltered'] == len(rows)
+
+
+def test_sharded_table_search(sharded_app):
+    rows = laptop_rows(120)
+    sharded_app.insert_rows('laptop_metrics', 'insert_laptop_metrics', rows)
+    page = table_page(sharded_app, **{'search[value]': 'host-1', 'length': '100'})
+    expected = sorted((row for row in rows if row[0].startswith('host-1')), key=lambda row: row[3], reverse=True)
+    assert page['recordsFiltered'] == len(expected)
+    assert [(row['computer_id'], row['timestamp']) for row in page['data']] == [(row[0], row[3]) for row in expected]
+
+
+def test_reshard_round_trip(tmp_path):
+    laptop, stock = laptop_rows(500), stock_rows(80)
+    source = str(tmp_path / 'database.db')
+    make_database(source, laptop, stock)
+
+    copied = reshard(source, str(tmp_path / 'four'), 4, batch_size=64)
+    assert copied == {'laptop_metrics': len(laptop), 'stock_metrics': len(stock)}
+    check_shards(str(tmp_path / 'four'), 4, laptop, stock)
+
+    # From one shard layout to another
+    reshard(str(tmp_path / 'four'), str(tmp_path / 'two'), 2, batch_size=64)
+    check_shards(str(tmp_path / 'two'), 2, laptop, stock)
+
+    # Rows written through the store get ids from their shard's range too
+    store = ShardedStore(str(tmp_path / 'two'))
+    try:
+        store.insert('laptop_metrics', 'insert_laptop_metrics', laptop[:10])
+    finally:
+        store.close()
+    check_shards(str(tmp_path / 'two'), 2, laptop + laptop[:10], stock)
+
+
+def test_reshard_refuses_non_empty_target(tmp_path):
+    source = str(tmp_path / 'database.db')
+    make_database(source, laptop_rows(10), [])
+    reshard(source, str(tmp_path / 'shards'), 2)
+    with pytest.raises(ValueError):
+        reshard(source, str(tmp_path / 'shards'), 2)
+
+
+def test_store_refuses_interrupted_reshard(tmp_path):
+    directory = tmp_path / 'partial'
+    directory.mkdir()
+    sharding.init_shard(sharding.shard_path(str(directory), 0), 0)
+    with pytest.raises(ValueError):
+        ShardedStore(str(directory), 2)
+    assert read_manifest(str(directory)) is None
+
+
+def test_store_refuses_other_shard_count(tmp_path):
+    ShardedStore(str(tmp_path / 'shards'), 3).close()
+    with pytest.raises(ValueError):
+        ShardedStore(str(tmp_path / 'shards'), 2)
+
+
+def test_maintenance_tools_use_every_shard(tmp_path, monkeypatch):
+    import clear_stock_data
+    import db_bulk
+    import db_cleanup
+
+    laptop, stock = laptop_rows(100), stock_rows(40)
+    source = str(tmp_path / 'database.db')
+    make_database(source, laptop, stock)
+    with sqlite3.connect(source) as conn:
+        conn.execute("UPDATE laptop_metrics SET timestamp = '2000-01-01 00:00:00' WHERE id <= 30")
+    reshard(source, str(tmp_path / 'shards'), 3)
+    monkeypatch.setattr(sharding, 'DEFAULT_SHARD_DIR', str(tmp_path / 'shards'))
+    monkeypatch.setenv('METRICS_SHARD_COUNT', '3')
+
+    exported = str(tmp_path / 'laptop.ndjson')
+    assert db_bulk.export_table('laptop_metrics', exported, database=sharding.metrics_database_paths()) == 100
+    with open(exported) as f:
+        ids = [int(line.split('"id": ')[1].split(',')[0]) for line in f]
+    assert ids == sorted(ids)
+
+    db_cleanup.cleanup_database(days_to_keep=3650)
+    assert clear_stock_data.clear_stock_data() == len(stock)
+    remaining = {table: sum(len(read_rows(path, table)) for path in sharding.metrics_database_paths())
+                 for table in COLUMNS}
+    assert remaining == {'laptop_metrics': 70, 'stock_metrics': 0}
+
+    monkeypatch.setenv('METRICS_SHARD_COUNT', '2')
+    with pytest.raises(ValueError):
+        sharding.metrics_database_paths()
+
+
+def test_profiled_request_records_shard_queries(sharded_app, monkeypatch):
+    sharded_app.insert_rows('laptop_metrics', 'insert_laptop_metrics', laptop_rows(30))
+    # Every statement counts as slow, so each one is logged with its route
+    monkeypatch.setattr(sharded_app.profiler, 'slow_query_seconds', 0)
+    response = sharded_app.app.test_client().get('/api/system_metrics/table', query_string={'draw': 1},
+                                                  headers={'X-Debug-Profile': '1'})
+    profile = sharded_app.profiler.get_profile(int(response.headers['X-Debug-Profile-Id']))
+    statements = [query['statement'] for query in profile['queries']]
+    assert statements.count('laptop_metrics_table_page') == 3
+    slow = [query for query in sharded_app.profiler.list_slow_queries()
+            if query['statement'] == 'laptop_metrics_table_page']
+    assert slow and all(query['route'] == '/api/system_metrics/table' for query in slow)
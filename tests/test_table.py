@@ -0,0 +1,16 @@
+import pytest
+
+
+@pytest.mark.parametrize('search', ['\U0010ffff', 'host-\U0010ffff\U0010ffff', 'host-퟿'])
+def test_table_search_at_the_end_of_unicode(app_module, search):
+    response = app_module.app.test_client().get('/api/system_metrics/table',
+                                                query_string={'draw': 1, 'search[value]': search})
+    page = response.get_json()
+    assert 'error' not in page and page['recordsFiltered'] == 0 and page['data'] == []
+
+
+def test_prefix_upper_bound(app_module):
+    assert app_module.prefix_upper_bound('host-1') == 'host-2'
+    assert app_module.prefix_upper_bound('ab\U0010ffff') == 'ac'
+    assert app_module.prefix_upper_bound('퟿') == ''
+    assert app_module.prefix_upper_bound('\U0010ffff') is None